@@ -79,7 +79,13 @@ setup(name='z3c.pt',
           ],
       extras_require=dict(
           test=['zope.testing', 'zope.testrunner'],
+          stream=['greenlet'],
       ),
+      entry_points={
+          'console_scripts': [
+              'z3c.pt-precompile = z3c.pt.precompile:main',
+              ],
+          },
       tests_require=['zope.testing'],
       test_suite='__main__.alltests',
       include_package_data=True,
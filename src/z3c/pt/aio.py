@@ -0,0 +1,92 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Render templates with asynchronous content providers.
+
+The ``update`` and ``render`` methods of content providers may be
+coroutines (or return awaitables) when a template is rendered using
+``render_async``: as with the ``batch_providers`` option (see
+``z3c.pt.expressions.ProviderBatch``), each ``provider:`` expression
+inserts a placeholder, and when the template is done, the pending
+updates and then the renders of all providers are awaited
+concurrently, and their output substituted for the placeholders.
+
+Provider output is escaped as it is when the template is rendered
+synchronously, unless it is inserted as structure.
+
+This module requires Python 3.5 or newer.
+"""
+import asyncio
+import inspect
+
+from z3c.pt import expressions
+from z3c.pt.expressions import ProviderBatch
+
+
+async def gather(awaitables):
+    """Await the awaitables among ``awaitables`` concurrently and
+    return the list of results (other items are returned as-is)."""
+
+    results = list(awaitables)
+    pending = [i for i, result in enumerate(results)
+               if inspect.isawaitable(result)]
+    if pending:
+        values = await asyncio.gather(*[results[i] for i in pending])
+        for i, value in zip(pending, values):
+            results[i] = value
+    return results
+
+
+class AsyncProviderBatch(ProviderBatch):
+    """Provider batch which awaits the updates and renders of the
+    providers concurrently."""
+
+    def __init__(self):
+        super(AsyncProviderBatch, self).__init__()
+        self.updates = []
+
+    def defer(self, cp, updated=None):
+        self.updates.append(updated)
+        return super(AsyncProviderBatch, self).defer(cp, updated)
+
+    async def render(self):
+        await gather(self.updates)
+        return await gather(cp.render() for cp in self.providers)
+
+    def close(self):
+        """Close pending updates (if rendering failed)."""
+
+        for updated in self.updates:
+            close = getattr(updated, 'close', None)
+            if close is not None:
+                close()
+
+    async def __call__(self, output):
+        return self.substitute(output, await self.render())
+
+
+async def render_async(render):
+    """Call ``render`` (which renders a template) and return its
+    output with the output of its content providers."""
+
+    batch = AsyncProviderBatch()
+    expressions._local.batch = batch
+    try:
+        output = render()
+    except:
+        batch.close()
+        raise
+    finally:
+        expressions._local.batch = None
+
+    return await batch(output)
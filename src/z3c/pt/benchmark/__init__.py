@@ -0,0 +1,85 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Micro-benchmarks for the hot paths of ``z3c.pt``.
+
+Each module in this package provides a ``run()`` function which
+returns a dictionary of measurements, and may be run as a script::
+
+  $ python -m z3c.pt.benchmark.builtins
+
+To run all benchmarks and write the results as JSON, or compare them
+to those of another revision (see ``z3c.pt.benchmark.runner``)::
+
+  $ python -m z3c.pt.benchmark --output before.json
+  $ python -m z3c.pt.benchmark --compare before.json
+"""
+import gc
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def timing(func, number=1000, repeat=3):
+    """Return the best time per call (in microseconds)."""
+
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        t = time.time()
+        for j in range(number):
+            func()
+        elapsed = time.time() - t
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best * 1e6 / number
+
+
+def allocations(func, number=100):
+    """Return the peak number of bytes allocated during a single call
+    (or ``None`` if ``tracemalloc`` is unavailable)."""
+
+    if tracemalloc is None:
+        return None
+
+    # Warm up caches before measuring
+    func()
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        peak = 0
+        for i in range(number):
+            current = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def report(title, results, stream=sys.stdout):
+    stream.write("%s\n%s\n" % (title, "-" * len(title)))
+    for name, value in sorted(results.items()):
+        if isinstance(value, float):
+            value = "%.2f" % value
+        stream.write("  %-40s %s\n" % (name, value))
+    stream.write("\n")
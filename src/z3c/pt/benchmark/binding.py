@@ -0,0 +1,90 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Binding templates to instances on attribute access."""
+
+import time
+
+from z3c.pt.benchmark import report
+from z3c.pt.pagetemplate import ViewPageTemplate
+
+
+class ClosureBoundPageTemplate(object):
+    # This is how templates were bound before (using a closure)
+    def __init__(self, pt, render):
+        object.__setattr__(self, 'im_self', pt)
+        object.__setattr__(self, 'im_func', render)
+
+    macros = property(lambda self: self.im_self.macros)
+
+
+class ClosureTemplate(ViewPageTemplate):
+    def __get__(self, instance, type):
+        if instance is not None:
+            return self.bind(instance)
+        return self
+
+    def bind(self, ob, request=None):
+        def render(request=request, **kwargs):
+            context = self._pt_get_context(ob, request, kwargs)
+            return self.render(**context)
+
+        return ClosureBoundPageTemplate(self, render)
+
+
+BODY = u"""<div metal:define-macro="main" />"""
+
+
+class View(object):
+    context = request = None
+    slots = ViewPageTemplate(BODY)
+    closure = ClosureTemplate(BODY)
+
+
+def measure(func, number):
+    """Return the time per iteration (in nanoseconds)."""
+
+    t = time.time()
+    func(number)
+    return (time.time() - t) * 1e9 / number
+
+
+def run(number=1000000):
+    view = View()
+
+    def slots(number):
+        for i in range(number):
+            view.slots
+
+    def closure(number):
+        for i in range(number):
+            view.closure
+
+    def slots_macros(number):
+        for i in range(number):
+            view.slots.macros
+
+    def closure_macros(number):
+        for i in range(number):
+            view.closure.macros
+
+    return {
+        'access (slots) ns': measure(slots, number),
+        'access (closure) ns': measure(closure, number),
+        'macros (slots) ns': measure(slots_macros, number),
+        'macros (closure) ns': measure(closure_macros, number),
+        }
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
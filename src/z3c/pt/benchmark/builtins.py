@@ -0,0 +1,71 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Template builtins: memoized versus rebuilt on every access."""
+
+from chameleon.compiler import ExpressionEvaluator
+
+from z3c.pt.benchmark import allocations
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import sys_modules
+
+BODY = """\
+<ul xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <li tal:repeat="item options/items"
+      tal:content="python: path('item/title')" />
+</ul>"""
+
+
+class Item(object):
+    def __init__(self, title):
+        self.title = title
+
+
+def uncached_builtins(template):
+    # This is how the builtins were computed before they were memoized
+    builtins = {
+        'nothing': None,
+        'modules': sys_modules,
+        }
+    builtins['tales'] = ExpressionEvaluator(template.engine, builtins)
+    return builtins
+
+
+def run(number=1000):
+    template = PageTemplate(BODY)
+    items = [Item(str(i)) for i in range(10)]
+
+    def fresh_template():
+        return PageTemplate(BODY)(items=items)
+
+    return {
+        'builtins (memoized) us': timing(
+            lambda: template.builtins, number),
+        'builtins (rebuilt) us': timing(
+            lambda: uncached_builtins(template), number),
+        'builtins (memoized) peak bytes': allocations(
+            lambda: template.builtins),
+        'builtins (rebuilt) peak bytes': allocations(
+            lambda: uncached_builtins(template)),
+        'new template per render us': timing(
+            fresh_template, number // 100),
+        'new template per render peak bytes': allocations(
+            fresh_template, 10),
+        }
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
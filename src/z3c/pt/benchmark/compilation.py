@@ -0,0 +1,62 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compiling templates and path expressions."""
+
+import ast
+
+from chameleon.loader import MemoryLoader
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.benchmark.macros import LAYOUT
+from z3c.pt.benchmark.render import LARGE
+from z3c.pt.benchmark.render import SMALL
+from z3c.pt.cache import TemplateCache
+from z3c.pt.expressions import PathExpr
+from z3c.pt.pagetemplate import PageTemplate
+
+
+class UncachedTemplate(PageTemplate):
+    # Each template is compiled from scratch
+    loader = TemplateCache(loader=MemoryLoader())
+
+
+def run(number=20, repeat=3):
+    results = {}
+    for name, body in (
+        ('small', SMALL),
+        ('large', LARGE),
+        ('layout', LAYOUT),
+        ):
+        def cook():
+            UncachedTemplate.loader.clear()
+            UncachedTemplate(body).cook_check()
+
+        results['template (%s) ms' % name] = timing(
+            cook, number, repeat) / 1000
+
+    target = ast.Name('target', ast.Store())
+    for name, expression in (
+        ('simple', 'context/title'),
+        ('long', 'context/a/b/c/d/e/f/title'),
+        ('namespace', 'context/@@view/ns:item/title'),
+        ):
+        results['path expression (%s) us' % name] = timing(
+            lambda: PathExpr(expression)(target, None), number * 100, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
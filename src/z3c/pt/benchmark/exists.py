@@ -0,0 +1,79 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Evaluating ``exists:`` for missing and present paths."""
+
+from chameleon.tales import ExistsExpr as BaseExistsExpr
+from zope.component import provideAdapter
+from zope.interface import Interface
+from zope.traversing.adapters import DefaultTraversable
+from zope.traversing.interfaces import ITraversable
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.expressions import ExistsExpr
+from z3c.pt.pagetemplate import PageTemplate
+
+BODY = u"""\
+<ul xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <li tal:repeat="i python: range(100)">
+    <span tal:condition="exists: options/form/%(key)s" />
+    <span tal:condition="exists: options/item/%(key)s" />
+    <span tal:condition="exists: options/item/form/%(key)s" />
+  </li>
+</ul>"""
+
+
+class RaisingExistsExpr(ExistsExpr):
+    # This is how paths were checked before: the missing segment
+    # raises an exception, which is caught
+    __call__ = BaseExistsExpr.__call__
+
+
+class RaisingTemplate(PageTemplate):
+    expression_types = dict(
+        PageTemplate.expression_types, exists=RaisingExistsExpr)
+
+
+class Item(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def run(number=200, repeat=5):
+    provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+    form = {'key': u"value"}
+    item = Item(key=u"value", form=form)
+
+    results = {}
+    for case, key in (('negative', 'missing'), ('positive', 'key')):
+        for name, factory in (
+            ('raising', RaisingTemplate),
+            ('probing', PageTemplate),
+            ):
+            template = factory(BODY % {'key': key})
+
+            def render():
+                template(form=form, item=item)
+
+            # Compile before measuring
+            render()
+            results['%s (%s) us' % (case, name)] = timing(
+                render, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,81 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Constant and static paths: folded versus traversed on each render."""
+
+from zope.component import provideAdapter
+from zope.interface import Interface
+from zope.interface import implementer
+from zope.security.proxy import removeSecurityProxy
+from zope.traversing.adapters import DefaultTraversable
+from zope.traversing.interfaces import ITraversable
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.expressions import PathExpr
+from z3c.pt.pagetemplate import PageTemplate
+from z3c.pt.pagetemplate import OpaqueDict
+
+BODY = u"""\
+<ul xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <li tal:repeat="i python: range(100)"
+      tal:attributes="title nothing; class nothing"
+      tal:content="modules/os/sep" />
+</ul>"""
+
+
+class UnfoldedPathExpr(PathExpr):
+    # This is how paths were compiled before constant folding
+    constant_bases = static_bases = ()
+
+
+class UnfoldedTemplate(PageTemplate):
+    expression_types = dict(
+        PageTemplate.expression_types, path=UnfoldedPathExpr)
+
+
+@implementer(ITraversable)
+class ModulesTraversable(DefaultTraversable):
+    """Looks up modules (as an application would, e.g. with a security
+    checker for the ``modules`` builtin)."""
+
+    def __init__(self, context, request=None):
+        self._subject = removeSecurityProxy(context)
+
+
+def setUp():
+    provideAdapter(ModulesTraversable, (OpaqueDict, ), ITraversable)
+    provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+
+
+def run(number=200, repeat=5):
+    setUp()
+    results = {}
+    # The static paths are only folded in trusted templates (the
+    # ``modules`` builtin is otherwise security proxied)
+    for name, template in (
+        ('traversed', UnfoldedTemplate(BODY)),
+        ('folded', PageTemplate(BODY)),
+        ('traversed, trusted', UnfoldedTemplate(BODY, trusted=True)),
+        ('folded, trusted', PageTemplate(BODY, trusted=True)),
+        ):
+        # Compile before measuring
+        template()
+        results['render (%s) us' % name] = timing(template, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,68 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Rendering a page using nested layout macros."""
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+LAYOUT = u"""\
+<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:tal="http://xml.zope.org/namespaces/tal"
+      xmlns:metal="http://xml.zope.org/namespaces/metal"
+      metal:define-macro="layout">
+  <head><title metal:define-slot="title">Title</title></head>
+  <body>
+    <div metal:define-macro="portlet" class="portlet">
+      <h2 metal:define-slot="header">Header</h2>
+      <div metal:define-slot="body">Body</div>
+    </div>
+    <div metal:define-slot="content">Content</div>
+  </body>
+</html>"""
+
+PAGE = u"""\
+<html xmlns="http://www.w3.org/1999/xhtml"
+      xmlns:tal="http://xml.zope.org/namespaces/tal"
+      xmlns:metal="http://xml.zope.org/namespaces/metal"
+      metal:use-macro="python: options['layout'].macros['layout']">
+  <title metal:fill-slot="title">Page</title>
+  <div metal:fill-slot="content">
+    <div tal:repeat="i python: range(20)">
+      <div metal:use-macro="python: options['layout'].macros['portlet']">
+        <h2 metal:fill-slot="header">Portlet ${i}</h2>
+        <div metal:fill-slot="body">
+          <p tal:repeat="j python: range(5)">${i}.${j}</p>
+        </div>
+      </div>
+    </div>
+  </div>
+</html>"""
+
+
+def run(number=100, repeat=5):
+    layout = PageTemplate(LAYOUT)
+    page = PageTemplate(PAGE)
+
+    # Compile before measuring
+    page(layout=layout)
+
+    return {
+        'page (20 portlets) us': timing(
+            lambda: page(layout=layout), number, repeat),
+        }
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,93 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Repeated path-expressions: traversed each time versus pure."""
+
+from z3c.pt import memo
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+BODY = u"""\
+<ul xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <li tal:repeat="i python: range(50)">
+    <a href="${%(type)s: view/%(url)s}/${i}"
+       title="${%(type)s: context/title}">${%(type)s: request/URL}</a>
+  </li>
+</ul>"""
+
+
+class Item(object):
+    def __init__(self, name, parent=None):
+        self.__name__ = name
+        self.__parent__ = parent
+
+    def title(self):
+        return self.__name__.capitalize()
+
+
+class View(object):
+    def __init__(self, context):
+        self.context = context
+
+    def site_url(self):
+        return u"http://localhost"
+
+    def portal_url(self):
+        # Computed from the names of the parents (like ``absoluteURL``)
+        names = []
+        item = self.context
+        while item is not None:
+            names.append(item.__name__)
+            item = item.__parent__
+        return u"/".join([self.site_url()] + names[::-1])
+
+
+class Request(object):
+    response = None
+    URL = u"http://localhost/page"
+
+    def __init__(self):
+        self.annotations = {}
+
+
+def run(number=200, repeat=5):
+    context = None
+    for name in 'site', 'folder', 'subfolder', 'document':
+        context = Item(name, context)
+    view = View(context)
+
+    results = {}
+    for case, url in (('simple', 'site_url'), ('computed', 'portal_url')):
+        for name in 'path', 'pure':
+            template = PageTemplate(BODY % {'type': name, 'url': url})
+
+            def render():
+                template.render(
+                    context=context, view=view, request=Request())
+
+            # Compile before measuring
+            render()
+            memo.reset()
+            results['%s (%s) us' % (case, name)] = timing(
+                render, number, repeat)
+
+    results['traversals saved per render'] = \
+        memo.stats()['hits'] // (number * repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
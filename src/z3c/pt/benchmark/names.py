@@ -0,0 +1,55 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""A table of 10000 rows: names looked up on evaluation versus resolved."""
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+ROWS = 10000
+
+BODY = u"""\
+<table xmlns="http://www.w3.org/1999/xhtml"
+       xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <tr tal:repeat="row python: rows">
+    <td tal:repeat="column python: columns"
+        tal:attributes="class python: 'odd' if row['id'] % 2 else None"
+        tal:content="python: str(row[column]).upper()" />
+    <td tal:content="python: len(row) + max(row['id'], limit)" />
+  </tr>
+</table>"""
+
+
+def run(number=5, repeat=3):
+    columns = ('id', 'name', 'title')
+    rows = [dict(id=i, name=u"name%d" % i, title=u"Title %d" % i)
+            for i in range(ROWS)]
+
+    results = {}
+    for name, template in (
+        ('looked up', PageTemplate(BODY, resolve_names=False)),
+        ('resolved', PageTemplate(BODY)),
+        ):
+        def render():
+            template.render(rows=rows, columns=columns, limit=0)
+
+        # Compile before measuring
+        render()
+        results['render (%s) us' % name] = timing(render, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
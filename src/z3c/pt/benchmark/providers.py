@@ -0,0 +1,115 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Content providers: factory lookup and batched update/render."""
+
+import time
+
+from zope.component import provideAdapter
+from zope.component import queryMultiAdapter
+from zope.contentprovider.interfaces import IContentProvider
+from zope.interface import Interface
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.expressions import query_content_provider
+from z3c.pt.pagetemplate import PageTemplate
+
+PROVIDERS = 20
+
+BODY = u"""\
+<div xmlns="http://www.w3.org/1999/xhtml"
+     xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <div tal:repeat="name options/names"
+       tal:replace="structure provider:${name}" />
+</div>"""
+
+
+class Backend(object):
+    """Fetches all pending keys in a single (slow) round trip."""
+
+    latency = 0.0005
+
+    def __init__(self):
+        self.pending = set()
+        self.fetched = {}
+        self.round_trips = 0
+
+    def want(self, key):
+        self.pending.add(key)
+
+    def get(self, key):
+        if key not in self.fetched:
+            time.sleep(self.latency)
+            self.round_trips += 1
+            for pending in self.pending:
+                self.fetched[pending] = u"<p>%s</p>" % pending
+            self.pending.clear()
+        return self.fetched[key]
+
+
+class Provider(object):
+    backend = None
+
+    def __init__(self, context, request, view):
+        pass
+
+    def update(self):
+        self.backend.want(self.__name__)
+
+    def render(self):
+        return self.backend.get(self.__name__)
+
+
+def setUp():
+    names = []
+    for i in range(PROVIDERS):
+        name = "provider%d" % i
+        factory = type(name, (Provider, ), {'__name__': name})
+        provideAdapter(
+            factory, (Interface, Interface, Interface),
+            IContentProvider, name=name)
+        names.append(name)
+    return names
+
+
+def run(number=100, repeat=5):
+    names = setUp()
+    results = {}
+
+    for batch in (False, True):
+        template = PageTemplate(BODY, batch_providers=batch)
+        mode = batch and 'batched' or 'sequential'
+
+        def render():
+            Provider.backend = Backend()
+            template.render(context=None, view=None, options={
+                'names': names})
+            return Provider.backend.round_trips
+
+        results['page (%s) round trips' % mode] = render()
+        results['page (%s) us' % mode] = timing(render, number, repeat)
+
+    results['lookup (cached) us'] = timing(
+        lambda: query_content_provider(None, None, None, "provider0"),
+        number * 100, repeat)
+    results['lookup (queryMultiAdapter) us'] = timing(
+        lambda: queryMultiAdapter(
+            (None, None, None), IContentProvider, "provider0"),
+        number * 100, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,70 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Render latency of small and large templates."""
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import ViewPageTemplate
+
+SMALL = u"""\
+<div xmlns="http://www.w3.org/1999/xhtml"
+     xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <h1 tal:content="context/title" />
+  <p tal:condition="view/description" tal:content="view/description" />
+</div>"""
+
+LARGE = u"""\
+<table xmlns="http://www.w3.org/1999/xhtml"
+       xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <tr tal:repeat="row options/rows"
+      tal:attributes="class python: repeat['row'].odd() and 'odd' or None">
+    <td tal:repeat="column row" tal:content="column/title" />
+    <td tal:condition="not: row">${repeat/row/index}</td>
+  </tr>
+</table>"""
+
+
+class Context(object):
+    title = u"Title"
+
+
+class View(object):
+    description = u"Description"
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    small = ViewPageTemplate(SMALL)
+    large = ViewPageTemplate(LARGE)
+
+
+def run(number=100, repeat=5):
+    context = Context()
+    view = View(context, None)
+    rows = [[context] * 10] * 100
+
+    # Compile before measuring
+    view.small()
+    view.large(rows=rows)
+
+    return {
+        'small us': timing(view.small, number * 10, repeat),
+        'large (100x10) us': timing(
+            lambda: view.large(rows=rows), number, repeat),
+        }
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,129 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Run the benchmarks and write or compare the results.
+
+Usage: python -m z3c.pt.benchmark [options] [benchmark ...]
+
+The results of all benchmarks (or those given) are written as JSON
+to the output file; with ``--compare``, they are compared to the
+results of a previous run (e.g. of another revision). All measurements
+are times or sizes, so lower is better.
+"""
+import sys
+import json
+import optparse
+import platform
+
+from z3c.pt.benchmark import report
+from z3c.pt.cache import get_version
+
+benchmarks = (
+    'compilation',
+    'render',
+    'traversal',
+    'folding',
+    'trusted',
+    'exists',
+    'memo',
+    'providers',
+    'translation',
+    'variants',
+    'macros',
+    'builtins',
+    'names',
+    'binding',
+    'startup',
+    'streaming',
+    'warmup',
+    )
+
+
+def run(names=benchmarks, stream=sys.stdout):
+    results = {}
+    for name in names:
+        module = __import__('z3c.pt.benchmark.' + name, fromlist=['run'])
+        results[name] = module.run()
+        if stream is not None:
+            report(module.__doc__.strip(), results[name], stream)
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'z3c.pt': get_version('z3c.pt'),
+        'chameleon': get_version('Chameleon'),
+        }
+
+
+def compare(baseline, results, threshold=0.1):
+    """Yield the benchmark, measurement, baseline and current value
+    and the relative change of each measurement in both results;
+    changes of more than ``threshold`` are marked.
+
+      >>> for row in compare({'a': {'x us': 2.0, 'y us': 2.0}},
+      ...                    {'a': {'x us': 3.0, 'y us': 2.1}}):
+      ...     print(row)
+      ('a', 'x us', 2.0, 3.0, '+50.0% (slower)')
+      ('a', 'y us', 2.0, 2.1, '+5.0%')
+    """
+
+    for name in sorted(results):
+        for key, value in sorted(results[name].items()):
+            base = baseline.get(name, {}).get(key)
+            if not base or value is None:
+                continue
+            change = float(value - base) / base
+            marker = ""
+            if change > threshold:
+                marker = " (slower)"
+            elif change < -threshold:
+                marker = " (faster)"
+            yield name, key, base, value, "%+.1f%%%s" % (change * 100, marker)
+
+
+def main(argv=None, stream=sys.stdout):
+    parser = optparse.OptionParser(
+        usage="%prog [options] [benchmark ...]")
+    parser.add_option(
+        "-o", "--output", dest="output",
+        help="write the results as JSON to this file")
+    parser.add_option(
+        "-c", "--compare", dest="compare",
+        help="compare the results to those in this file")
+    parser.add_option(
+        "-t", "--threshold", dest="threshold", type="float", default=0.1,
+        help="mark changes greater than this (default: 0.1)")
+
+    options, args = parser.parse_args(argv)
+
+    for name in args:
+        if name not in benchmarks:
+            parser.error("no such benchmark: %s." % name)
+
+    results = run(args or benchmarks, stream)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results},
+                      f, indent=1, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+        for row in compare(baseline, results, options.threshold):
+            stream.write("%-12s %-40s %10.2f %10.2f  %s\n" % row)
+
+    return 0
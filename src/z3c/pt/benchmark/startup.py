@@ -0,0 +1,111 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Importing a module which declares 500 template files."""
+
+import os
+import sys
+import shutil
+import tempfile
+
+from chameleon.zpt import template
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+TEMPLATES = 500
+
+
+class FrameTemplateFile(ViewPageTemplateFile):
+    # This is how relative paths were resolved (and the template
+    # loader set up) before
+    def __init__(self, filename, path=None, content_type=None, **kwargs):
+        if not os.path.isabs(filename):
+            for depth in (1, 2):
+                frame = sys._getframe(depth)
+                package_name = frame.f_globals.get('__name__', None)
+                if package_name is not None and \
+                       package_name != self.__module__:
+                    module = sys.modules[package_name]
+                    try:
+                        path = module.__path__[0]
+                    except AttributeError:
+                        path = module.__file__
+                        path = path[:path.rfind(os.sep)]
+                    break
+                else:
+                    package_path = frame.f_globals.get('__file__', None)
+                    if package_path is not None:
+                        path = os.path.dirname(package_path)
+                        break
+
+            if path is not None:
+                filename = os.path.join(path, filename)
+
+        template.PageTemplateFile.__init__(self, filename, **kwargs)
+        self.content_type = content_type
+
+
+MODULE = """\
+from z3c.pt.benchmark.startup import FrameTemplateFile
+from z3c.pt.pagetemplate import ViewPageTemplateFile
+
+class View(object):
+    pass
+"""
+
+DECLARATION = "\nView.template%d = %s('template%d.pt'%s)"
+
+
+def write_module(path, name, factory, extra=""):
+    with open(os.path.join(path, name + '.py'), 'w') as f:
+        f.write(MODULE)
+        for i in range(TEMPLATES):
+            f.write(DECLARATION % (i, factory, i, extra))
+
+
+def run(number=20, repeat=5):
+    path = tempfile.mkdtemp()
+    sys.path.insert(0, path)
+    modules = {
+        'before': ('z3cpt_frame', 'FrameTemplateFile', ''),
+        'caller': ('z3cpt_cached', 'ViewPageTemplateFile', ''),
+        'package': (
+            'z3cpt_package', 'ViewPageTemplateFile', ', package=__name__'),
+        }
+
+    try:
+        results = {}
+        for label, (name, factory, extra) in modules.items():
+            write_module(path, name, factory, extra)
+            filename = os.path.join(path, name + '.py')
+            with open(filename) as f:
+                code = compile(f.read(), filename, 'exec')
+
+            def load():
+                module = type(sys)(name)
+                module.__file__ = filename
+                sys.modules[name] = module
+                exec(code, module.__dict__)
+
+            results['import (%s) us' % label] = timing(load, number, repeat)
+
+        return results
+    finally:
+        sys.path.remove(path)
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
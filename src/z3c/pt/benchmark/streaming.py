@@ -0,0 +1,62 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Rendering a large listing in full versus in chunks."""
+
+import time
+
+from z3c.pt.benchmark import allocations
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+BODY = u"""\
+<table xmlns="http://www.w3.org/1999/xhtml"
+       xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <tr tal:repeat="row rows">
+    <td tal:repeat="column row">${column}</td>
+  </tr>
+</table>"""
+
+
+def run(rows=10000, number=3):
+    template = PageTemplate(BODY)
+    table = [[u"%d:%d" % (i, j) for j in range(10)] for i in range(rows)]
+
+    def render():
+        return template.render(rows=table)
+
+    def consume():
+        for chunk in template.render_iter(rows=table):
+            pass
+
+    def first_chunk():
+        t = time.time()
+        chunks = template.render_iter(rows=table)
+        next(chunks)
+        elapsed = time.time() - t
+        chunks.close()
+        return elapsed * 1e6
+
+    return {
+        'render us': timing(render, number),
+        'render_iter us': timing(consume, number),
+        'render peak bytes': allocations(render, 1),
+        'render_iter peak bytes': allocations(consume, 1),
+        'render_iter first chunk us': min(
+            first_chunk() for i in range(number)),
+        }
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,109 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Translation: per-render versus per-request negotiation and memo."""
+
+from zope import i18n
+from zope.component import provideUtility
+from zope.i18n.interfaces import INegotiator
+from zope.i18n.negotiator import Negotiator
+from zope.i18n.simpletranslationdomain import SimpleTranslationDomain
+from zope.i18n.interfaces import IUserPreferredLanguages
+from zope.interface import implementer
+
+from chameleon.i18n import fast_translate
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+TEMPLATES = 30
+
+BODY = u"""\
+<div xmlns="http://www.w3.org/1999/xhtml"
+     xmlns:i18n="http://xml.zope.org/namespaces/i18n"
+     i18n:domain="benchmark">
+  <p i18n:translate="">Hello</p>
+  <p i18n:translate="">Goodbye</p>
+  <p i18n:translate="">Welcome</p>
+</div>"""
+
+
+@implementer(IUserPreferredLanguages)
+class Request(object):
+    response = None
+
+    def __init__(self):
+        self.annotations = {}
+
+    def getPreferredLanguages(self):
+        return ['de', 'en']
+
+
+class UncachedTemplate(PageTemplate):
+    # This is how the translation function was set up before it was
+    # cached on the request
+    def render(self, target_language=None, **context):
+        request = context.setdefault('request', None)
+
+        if target_language is None:
+            try:
+                target_language = i18n.negotiate(request)
+            except:
+                target_language = None
+
+        context['target_language'] = target_language
+
+        def translate(
+            msgid, domain=None, mapping=None,
+            target_language=None, default=None,
+            context=None):
+            return fast_translate(
+                msgid, domain, mapping, request, target_language, default)
+        context["translate"] = translate
+
+        return super(PageTemplate, self).render(**context)
+
+
+def setUp():
+    i18n.ALLOWED_LANGUAGES = ('de', 'en')
+    provideUtility(Negotiator(), INegotiator)
+    messages = {}
+    for msgid in (u"Hello", u"Goodbye", u"Welcome"):
+        messages[('de', msgid)] = msgid.upper()
+    provideUtility(
+        SimpleTranslationDomain('benchmark', messages),
+        name='benchmark')
+
+
+def run(number=100, repeat=5):
+    setUp()
+    results = {}
+    for name, template in (
+        ('per render', UncachedTemplate(BODY)),
+        ('per request', PageTemplate(BODY)),
+        ('per request, memo', PageTemplate(
+            BODY, memoize_translations=True)),
+        ):
+        def page():
+            request = Request()
+            for i in range(TEMPLATES):
+                template.render(request=request)
+
+        results['page (%s) us' % name] = timing(page, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,90 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Path traversal over dictionary, attribute and adapter bases."""
+
+from zope.component import provideAdapter
+from zope.interface import Interface
+from zope.traversing.adapters import DefaultTraversable
+from zope.traversing.interfaces import ITraversable
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.expressions import path_traverse
+
+
+class Attribute(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Container(object):
+    """Items are only reachable using the ``ITraversable`` adapter."""
+
+    def __init__(self, **kwargs):
+        self.items = kwargs
+
+    def __getitem__(self, name):
+        return self.items[name]
+
+
+class Acquirer(Container):
+    """Failed attribute lookups are expensive (as with acquisition)."""
+
+    parents = 20
+
+    def __getattr__(self, name):
+        # Simulate searching a chain of parents
+        for i in range(self.parents):
+            getattr(Attribute, name, None)
+        raise AttributeError(name)
+
+
+def setUp():
+    provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+
+
+def make_cache(path_items):
+    return [{} for item in path_items]
+
+
+def run(number=10000, repeat=5):
+    setUp()
+
+    leaf = Attribute(title=u"Title")
+    bases = {
+        'dict': {'a': {'b': {'c': leaf}}},
+        'attribute': Attribute(a=Attribute(b=Attribute(c=leaf))),
+        'adapter': Container(a=Container(b=Container(c=leaf))),
+        }
+    bases['acquisition'] = Acquirer(a=Acquirer(b=Acquirer(c=leaf)))
+    bases['mixed'] = {'a': Attribute(b=Container(c=leaf))}
+
+    econtext = {'request': None}
+    path_items = ('a', 'b', 'c', 'title')
+    results = {}
+
+    for name, base in sorted(bases.items()):
+        cache = make_cache(path_items)
+        results['%s (inline cache) us' % name] = timing(
+            lambda: path_traverse(base, econtext, False, path_items, cache),
+            number, repeat)
+        results['%s (no cache) us' % name] = timing(
+            lambda: path_traverse(base, econtext, False, path_items),
+            number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,57 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Traversing security proxied objects: checked versus trusted."""
+
+from zope.security.checker import NamesChecker
+from zope.security.checker import defineChecker
+from zope.security.checker import ProxyFactory
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+BODY = u"""\
+<ul xmlns="http://www.w3.org/1999/xhtml"
+    xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <li tal:repeat="i python: range(100)"
+      tal:content="context/a/b/title" />
+</ul>"""
+
+
+class Item(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def run(number=200, repeat=5):
+    defineChecker(Item, NamesChecker(['a', 'b', 'title']))
+    context = ProxyFactory(Item(a=Item(b=Item(title=u"Title"))))
+
+    results = {}
+    for name, template in (
+        ('checked', PageTemplate(BODY)),
+        ('trusted', PageTemplate(BODY, trusted=True)),
+        ):
+        def render():
+            template.render(context=context)
+
+        # Compile before measuring
+        render()
+        results['render (%s) us' % name] = timing(render, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,61 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Static messages translated on render versus in a language variant."""
+
+from zope.component import provideUtility
+from zope.i18n.simpletranslationdomain import SimpleTranslationDomain
+
+from z3c.pt.benchmark import report
+from z3c.pt.benchmark import timing
+from z3c.pt.pagetemplate import PageTemplate
+
+MESSAGES = 50
+
+BODY = u"""\
+<div xmlns="http://www.w3.org/1999/xhtml"
+     xmlns:i18n="http://xml.zope.org/namespaces/i18n"
+     i18n:domain="benchmark-variants">
+%s
+</div>""" % u"\n".join(
+    u'  <p i18n:translate="">Message %d</p>' % i for i in range(MESSAGES))
+
+
+def setUp():
+    messages = {}
+    for i in range(MESSAGES):
+        msgid = u"Message %d" % i
+        messages[('de', msgid)] = msgid.upper()
+    provideUtility(
+        SimpleTranslationDomain('benchmark-variants', messages),
+        name='benchmark-variants')
+
+
+def run(number=1000, repeat=5):
+    setUp()
+    results = {}
+    for name, template in (
+        ('on render', PageTemplate(BODY)),
+        ('variant', PageTemplate(BODY, languages=('de', ))),
+        ):
+        def render():
+            template.render(target_language='de')
+
+        assert u"MESSAGE 0" in template.render(target_language='de')
+        results['render (%s) us' % name] = timing(render, number, repeat)
+
+    return results
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,67 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compiling 200 template files one at a time versus in a pool."""
+
+import os
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from z3c.pt.benchmark import report
+from z3c.pt.loader import TemplateLoader
+from z3c.pt.pagetemplate import PageTemplateFile
+
+TEMPLATES = 200
+
+BODY = u"""\
+<table xmlns:tal="http://xml.zope.org/namespaces/tal">
+  <tr tal:repeat="row rows">
+    <td tal:repeat="column row" tal:content="column" />
+    <td tal:condition="not:row">%d</td>
+  </tr>
+</table>
+"""
+
+
+def run():
+    path = tempfile.mkdtemp()
+    try:
+        for i in range(TEMPLATES):
+            with open(os.path.join(path, 'template%d.pt' % i), 'w') as f:
+                f.write(BODY % i)
+
+        loader = TemplateLoader(path)
+        results = {}
+
+        PageTemplateFile.loader.clear()
+        t = time.time()
+        for filename in loader.find(['*.pt']):
+            PageTemplateFile(filename).cook_check()
+        results['serial s'] = time.time() - t
+
+        processes = multiprocessing.cpu_count()
+        PageTemplateFile.loader.clear()
+        t = time.time()
+        loader.warm_up(['*.pt'], processes=processes)
+        results['warm_up (%d processes) s' % processes] = time.time() - t
+
+        return results
+    finally:
+        PageTemplateFile.loader.clear()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    report(__doc__.strip(), run())
@@ -0,0 +1,322 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import os
+import sys
+import marshal
+import threading
+
+import zope.component
+import zope.event
+
+from zope.interface.interfaces import IRegistrationEvent
+
+from chameleon.loader import ModuleLoader
+
+try:
+    import pkg_resources
+except ImportError:
+    pkg_resources = None
+
+_marker = object()
+
+# Caches which are cleared when a component registration changes
+_registry_caches = []
+
+# Link layout
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """Thread-safe mapping which holds at most ``maxsize`` entries,
+    evicting the least recently used entry first.
+
+      >>> cache = LRUCache(2)
+      >>> cache['a'] = 1
+      >>> cache['b'] = 2
+      >>> cache.get('a')
+      1
+      >>> cache['c'] = 3
+      >>> cache.get('b') is None
+      True
+      >>> sorted(cache.keys())
+      ['a', 'c']
+
+    The cache keeps count of hits, misses and evictions:
+
+      >>> sorted(cache.stats().items())
+      [('evictions', 1), ('hits', 1), ('maxsize', 2), ('misses', 1),
+       ('size', 2)]
+
+      >>> cache.clear()
+      >>> len(cache)
+      0
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._move_to_front(link)
+            return link[VALUE]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            link = self._data.get(key)
+            if link is not None:
+                link[VALUE] = value
+                self._move_to_front(link)
+                return
+
+            root = self._root
+            last = root[PREV]
+            link = [last, root, key, value]
+            last[NEXT] = root[PREV] = self._data[key] = link
+
+            while len(self._data) > self.maxsize:
+                self._evict()
+
+    def pop(self, key, default=_marker):
+        with self._lock:
+            link = self._data.pop(key, None)
+            if link is None:
+                if default is _marker:
+                    raise KeyError(key)
+                return default
+
+            self._unlink(link)
+            return link[VALUE]
+
+    def evict(self):
+        """Evict the least recently used entry (if any)."""
+
+        with self._lock:
+            if self._data:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            root = self._root
+            root[:] = [root, root, None, None]
+
+    def evicted(self, key, value):
+        """Called (with the lock held) when an entry is evicted."""
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            }
+
+    def _evict(self):
+        oldest = self._root[NEXT]
+        self._unlink(oldest)
+        del self._data[oldest[KEY]]
+        self.evictions += 1
+        self.evicted(oldest[KEY], oldest[VALUE])
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _move_to_front(self, link):
+        self._unlink(link)
+        root = self._root
+        last = root[PREV]
+        link[PREV] = last
+        link[NEXT] = root
+        last[NEXT] = root[PREV] = link
+
+
+class TemplateCache(object):
+    """Template loader which keeps compiled templates in memory.
+
+    The cache is shared by all template instances and classes; since
+    the name of a compiled template is derived from a digest of its
+    filename, source and the configuration which affects compilation,
+    templates which compile to the same program share it. Compiling
+    (and loading from disk) is delegated to ``loader``.
+
+    The cache holds at most ``maxsize`` templates and (optionally)
+    ``maxbytes`` bytes of marshalled byte-code:
+
+      >>> from chameleon.loader import MemoryLoader
+      >>> cache = TemplateCache(2, loader=MemoryLoader())
+      >>> source = "def initialize():\\n    return {}\\n"
+      >>> program = cache.build(source, "a.py")
+      >>> cache.get("a.py") is program
+      True
+      >>> program = cache.build(source, "b.py")
+      >>> program = cache.build(source, "c.py")
+      >>> cache.get("a.py") is None
+      True
+      >>> stats = cache.stats()
+      >>> stats['entries'], stats['hits'], stats['misses'], stats['evictions']
+      (2, 1, 1, 1)
+      >>> stats['bytes'] > 0
+      True
+    """
+
+    def __init__(self, maxsize=1000, maxbytes=None, loader=None):
+        self.loader = loader
+        self.maxbytes = maxbytes
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.programs = programs = LRUCache(maxsize)
+
+        def evicted(key, value):
+            self.bytes -= value[0]
+
+        programs.evicted = evicted
+
+    def get(self, filename):
+        entry = self.programs.get(filename)
+        if entry is not None:
+            return entry[1]
+
+        program = self.loader.get(filename)
+        if program is not None:
+            self._store(filename, program)
+        return program
+
+    def build(self, source, filename):
+        program = self.loader.build(source, filename)
+        self._store(filename, program)
+        return program
+
+    def load(self, filename, code):
+        """Store the program of a (marshalled) code object compiled
+        elsewhere, e.g. in another process."""
+
+        if filename in self.programs:
+            return self.programs.get(filename)[1]
+
+        if isinstance(code, bytes):
+            code = marshal.loads(code)
+
+        program = {}
+        exec(code, program)
+        self._store(filename, program)
+        return program
+
+    def clear(self):
+        with self._lock:
+            self.programs.clear()
+            self.bytes = 0
+
+    def stats(self):
+        stats = self.programs.stats()
+        stats['entries'] = stats.pop('size')
+        stats['bytes'] = self.bytes
+        stats['maxbytes'] = self.maxbytes
+        return stats
+
+    def _store(self, filename, program):
+        try:
+            size = len(marshal.dumps(program['initialize'].__code__))
+        except (KeyError, AttributeError, ValueError):
+            size = 0
+
+        with self._lock:
+            programs = self.programs
+            old = programs.pop(filename, None)
+            if old is not None:
+                self.bytes -= old[0]
+
+            self.bytes += size
+            programs[filename] = size, program
+
+            if self.maxbytes is not None:
+                while self.bytes > self.maxbytes and len(programs) > 1:
+                    programs.evict()
+
+
+def clear_on_registry_change(cache):
+    """Register ``cache`` (an object with a ``clear`` method) to be
+    cleared when components are registered or unregistered."""
+
+    _registry_caches.append(cache)
+    return cache
+
+
+def adapter_registry():
+    """Return the adapter registry of the current site and its
+    generation, which changes with every registration (including
+    those made without an event, e.g. using ``provideAdapter``)."""
+
+    adapters = zope.component.getSiteManager().adapters
+    return adapters, adapters._generation
+
+
+def get_version(project):
+    if pkg_resources is not None:
+        try:
+            return pkg_resources.get_distribution(project).version
+        except pkg_resources.DistributionNotFound:
+            pass
+
+    return "unknown"
+
+
+def versioned_path(path):
+    """Return the subdirectory of ``path`` for compiled templates of
+    the installed z3c.pt and Chameleon versions and the running Python
+    version; upgrading either starts from an empty cache."""
+
+    return os.path.join(path, "z3c.pt-%s-chameleon-%s-py%d.%d" % (
+        (get_version("z3c.pt"), get_version("Chameleon")) +
+        sys.version_info[:2]))
+
+
+def persistent_loader(path):
+    """Return a module loader which keeps compiled templates (and their
+    byte-code) in the versioned subdirectory of ``path``."""
+
+    path = versioned_path(path)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    return ModuleLoader(path)
+
+
+def _handle_registration(event):
+    if IRegistrationEvent.providedBy(event):
+        for cache in _registry_caches:
+            cache.clear()
+
+zope.event.subscribers.append(_handle_registration)
@@ -11,38 +11,86 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import os
 import re
 import ast
+import binascii
+import threading
 import z3c.pt.namespaces
 import zope.event
 
 from zope.traversing.adapters import traversePathElement
+from zope.traversing.adapters import DefaultTraversable
 from zope.contentprovider.interfaces import IContentProvider
 from zope.contentprovider.interfaces import ContentProviderLookupError
 from zope.contentprovider.tales import addTALNamespaceData
 from zope.traversing.interfaces import ITraversable
 from zope.location.interfaces import ILocation
+from zope.location.interfaces import LocationError
+from zope.interface import providedBy
+from zope.security.proxy import removeSecurityProxy
 
 try:
     from zope.contentprovider.interfaces import BeforeUpdateEvent
 except ImportError:
     BeforeUpdateEvent = None
 
+try:
+    from ast import TryExcept
+except ImportError:
+    from ast import Try as TryExcept
+
+from functools import partial
 from types import MethodType
 
+from chameleon.compiler import Compiler
+from chameleon.compiler import ExpressionEvaluator as BaseExpressionEvaluator
+from chameleon.nodes import Assignment
+from chameleon.nodes import Context
+from chameleon.nodes import Module
 from chameleon.tales import TalesExpr
 from chameleon.tales import ExistsExpr as BaseExistsExpr
 from chameleon.tales import PythonExpr as BasePythonExpr
 from chameleon.tales import StringExpr
+from chameleon.tales import resolve_global
 from chameleon.codegen import template
 from chameleon.astutil import load
 from chameleon.astutil import Symbol
+from chameleon.astutil import Static
 from chameleon.astutil import Builtin
 from chameleon.astutil import NameLookupRewriteVisitor
+from chameleon.astutil import store
 from chameleon.exc import ExpressionError
+from chameleon.utils import ImportableMarker
+
+from z3c.pt.cache import LRUCache
+from z3c.pt.cache import adapter_registry
+from z3c.pt.cache import clear_on_registry_change
+from z3c.pt.fragment import CachingProvider
+from z3c.pt.fragment import fragment_cache
+from z3c.pt.fragment import provider_key
+from z3c.pt.memo import get_memo
 
 _marker = object()
 
+# Returned by the probing traverser for a path which does not exist
+MISSING_MARKER = ImportableMarker(__name__, "MISSING")
+
+_local = threading.local()
+
+# Expressions compiled at runtime by the ``tales`` builtin (that is,
+# ``path()`` and ``exists()`` in Python-expressions)
+expression_cache = LRUCache(1024)
+
+
+# Content provider factories by name and the interfaces provided by
+# context, request and view
+provider_factories = clear_on_registry_change({})
+
+# Whether objects are traversed using the default traversal adapter,
+# by the interfaces they provide (see ``probe_element``)
+default_traversables = clear_on_registry_change({})
+
 
 def render_content_provider(econtext, name):
     name = name.strip()
@@ -51,8 +99,7 @@ def render_content_provider(econtext, name):
     request = econtext.get('request')
     view = econtext.get('view')
 
-    cp = zope.component.queryMultiAdapter(
-        (context, request, view), IContentProvider, name=name)
+    cp = query_content_provider(context, request, view, name)
 
     # provide a useful error message, if the provider was not found.
     if cp is None:
@@ -65,34 +112,224 @@ def render_content_provider(econtext, name):
     # Insert the data gotten from the context
     addTALNamespaceData(cp, econtext)
 
+    # The output may be in the fragment cache, if the provider has a
+    # cache key (see ``z3c.pt.fragment``)
+    key = provider_key(cp, name)
+    if key is not None:
+        output = fragment_cache.get(key)
+        if output is not None:
+            return output
+
     # Stage 1: Do the state update.
     if BeforeUpdateEvent is not None:
         zope.event.notify(BeforeUpdateEvent(cp, request))
-    cp.update()
+    updated = cp.update()
+
+    if key is not None:
+        cp = CachingProvider(cp, key, getattr(cp, 'fragment_ttl', None))
+
+    # Stage 2: Render the HTML content (possibly deferred until all
+    # the providers of the template have been updated).
+    batch = econtext.get('__provider_batch')
+    if batch is not None:
+        return batch.defer(cp, updated)
 
-    # Stage 2: Render the HTML content.
     return cp.render()
 
 
-def path_traverse(base, econtext, call, path_items):
-    if path_items:
-        request = econtext.get('request')
-        path_items = list(path_items)
-        path_items.reverse()
+def query_content_provider(context, request, view, name):
+    """Look up a content provider; this is equivalent to
+    ``queryMultiAdapter`` except that the factory is cached for the
+    interfaces provided by the objects and the current registry."""
+
+    registry = adapter_registry()
+    specs = providedBy(context), providedBy(request), providedBy(view)
+    key = (name, ) + specs
+    entry = provider_factories.get(key)
+    if entry is None or entry[0] != registry:
+        factory = registry[0].lookup(specs, IContentProvider, name)
+        entry = provider_factories[key] = registry, factory
+
+    factory = entry[1]
+    if factory is None:
+        return None
+
+    return factory(context, request, view)
+
+
+class ProviderBatch(object):
+    """Renders content providers after the template is done.
+
+    When a template renders with ``batch_providers`` enabled, each
+    ``provider:`` expression updates its provider right away, but
+    inserts a placeholder in place of the rendered output. The
+    providers are rendered (in document order) when all of them have
+    been updated, such that providers can share backend fetches
+    between the update and render stages.
+
+    The placeholder contains characters which are escaped unless the
+    expression is inserted as structure; the output is escaped in the
+    same way when it is substituted. Note that a placeholder is always
+    true in a condition.
+    """
+
+    def __init__(self):
+        self.providers = []
+        self.prefix = "%s:" % binascii.hexlify(os.urandom(8)).decode()
+
+        # The null characters may be escaped as well
+        self.regex = re.compile(
+            "(<|&lt;)(?:\x00|&#0;)" + re.escape(self.prefix) +
+            "(\\d+)(\"|&[^;]+;)('|&[^;]+;)(?:\x00|&#0;)(?:>|&gt;)")
+
+    def defer(self, cp, updated=None):
+        """Defer rendering ``cp``; ``updated`` is what its ``update``
+        method returned. Returns a placeholder for the output."""
+
+        self.providers.append(cp)
+        return "<\x00%s%d\"'\x00>" % (self.prefix, len(self.providers) - 1)
+
+    def render(self):
+        return [cp.render() for cp in self.providers]
+
+    def substitute(self, output, rendered):
+        if not rendered:
+            return output
+
+        def replace(m):
+            value = rendered[int(m.group(2))]
+            if m.group(1) == "<" or value is None:
+                return value or ""
 
-        while len(path_items):
-            name = path_items.pop()
-            ns_used = ':' in name
-            if ns_used:
-                namespace, name = name.split(':', 1)
-                base = z3c.pt.namespaces.function_namespaces[namespace](base)
-                if ITraversable.providedBy(base):
-                    base = traversePathElement(
-                        base, name, path_items, request=request)
+            # The placeholder was escaped (and so its quotes, if in an
+            # attribute); this is how the output would be escaped
+            value = value.replace("&", "&amp;").replace(
+                "<", "&lt;").replace(">", "&gt;")
+            if m.group(3) != '"':
+                value = value.replace('"', m.group(3))
+            if m.group(4) != "'":
+                value = value.replace("'", m.group(4))
+            return value
 
-                    # base = proxify(base)
+        return self.regex.sub(replace, output)
 
+    def __call__(self, output):
+        return self.substitute(output, self.render())
+
+
+def pop_provider_batch():
+    """Return (and forget) the provider batch set up for the next
+    template to render, if any (see ``z3c.pt.aio``)."""
+
+    batch = getattr(_local, 'batch', None)
+    if batch is not None:
+        _local.batch = None
+    return batch
+
+
+# Maximum number of types remembered per path segment
+INLINE_CACHE_SIZE = 4
+
+
+def path_traverse(base, econtext, call, path_items, cache=None,
+                  default=_marker):
+    """Traverse ``path_items`` from ``base``.
+
+    The path items are a plan prepared at compile time (see
+    ``PathExpr.translate``); each item is one of:
+
+    - a string, naming a segment without a namespace;
+    - a tuple ``(namespace, name)`` for a segment such as ``fmt:date``;
+    - a tuple ``(None, name)`` for an interpolated segment, where any
+      namespace is only known at runtime.
+
+    The plan is walked in place; a list of the remaining names is only
+    built when we fall back to ``traversePathElement``.
+
+    The optional ``cache`` is the inline cache of the call site: a
+    sequence with a dictionary for each path item, mapping the type of
+    the base object to the lookup which resolved the segment last time
+    (dictionary, attribute or adapter lookup). Note that this
+    assumes that a segment resolves the same way for all instances of
+    a type; set ``PathExpr.inline_cache`` to false if it does not.
+
+    If a ``default`` is given, it is returned as soon as a segment is
+    not found (see ``probe_element``) instead of raising an exception.
+    """
+
+    if path_items:
+        request = econtext.get('request')
+        length = len(path_items)
+        i = 0
+
+        while i < length:
+            name = path_items[i]
+            i += 1
+
+            ns_used = False
+            if name.__class__ is not tuple:
+                if cache is not None:
+                    strategies = cache[i - 1]
+                    cls = type(base)
+                    lookup = strategies.get(cls)
+                    if lookup is None:
+                        if isinstance(base, dict):
+                            lookup = cls.get
+                        else:
+                            lookup = getattr
+                        next = lookup(base, name, _marker)
+
+                        # The attribute lookup is skipped only if the
+                        # adapter would make it first anyway
+                        if next is _marker and lookup is getattr and \
+                               is_default_traversable(base):
+                            lookup = _adapter_only
+
+                        # Security proxies misreport their class
+                        if cls is base.__class__ and \
+                               len(strategies) < INLINE_CACHE_SIZE:
+                            strategies[cls] = lookup
+                    else:
+                        # The interfaces provided by the instance may
+                        # select another adapter than for its class
+                        if lookup is _adapter_only and \
+                               not is_default_traversable(base):
+                            lookup = getattr
+                        next = lookup(base, name, _marker)
+
+                    if next is not _marker:
+                        base = next
+                    else:
+                        previous = path_items
+                        base, path_items, i = _traverse_element(
+                            base, name, path_items, i, request, default)
+                        if base is default:
+                            return base
+                        if path_items is not previous:
+                            length = len(path_items)
+                            cache = None
                     continue
+            else:
+                namespace, name = name
+                if namespace is None and ':' in name:
+                    namespace, name = name.split(':', 1)
+                if namespace is not None:
+                    ns_used = True
+                    base = z3c.pt.namespaces.function_namespaces[namespace](
+                        base)
+                    if ITraversable.providedBy(base):
+                        previous = path_items
+                        base, path_items, i = _traverse_element(
+                            base, name, path_items, i, request, default)
+                        if base is default:
+                            return base
+                        if path_items is not previous:
+                            length = len(path_items)
+                            cache = None
+
+                        # base = proxify(base)
+
+                        continue
 
             # special-case dicts for performance reasons
             if isinstance(base, dict):
@@ -106,8 +343,14 @@ def path_traverse(base, econtext, call, path_items):
                     base = base()
                 continue
             else:
-                base = traversePathElement(
-                    base, name, path_items, request=request)
+                previous = path_items
+                base, path_items, i = _traverse_element(
+                    base, name, path_items, i, request, default)
+                if base is default:
+                    return base
+                if path_items is not previous:
+                    length = len(path_items)
+                    cache = None
 
             # if not isinstance(base, (basestring, tuple, list)):
             #    base = proxify(base)
@@ -118,6 +361,277 @@ def path_traverse(base, econtext, call, path_items):
     return base
 
 
+def call_value(value):
+    """Return the result of calling ``value`` if it's callable, as
+    for a path which is traversed (see ``PathExpr.constant_bases``)."""
+
+    if getattr(value, '__call__', _marker) is not _marker:
+        return value()
+    return value
+
+
+def static_traverse(memo, traverse, base, econtext, call, path_items):
+    """Traverse ``path_items`` from ``base`` (using ``traverse``) and
+    remember the result in ``memo``, a list which belongs to the call
+    site; the path is not traversed again for as long as ``base`` is
+    the same object.
+
+    This is used for paths from builtins such as ``modules`` (see
+    ``PathExpr.static_bases``) whose result is the same for each
+    render. The result is not remembered if ``base`` is security
+    proxied, since the security checks depend on the interaction (the
+    ``modules`` builtin is proxied unless the template is trusted).
+
+      >>> import os
+      >>> memo = []
+      >>> modules = {'os': os}
+      >>> static_traverse(
+      ...     memo, path_traverse, modules, {}, True, ('os', 'sep')) is os.sep
+      True
+      >>> memo[0][1] is os.sep
+      True
+
+      >>> from zope.security.checker import ProxyFactory
+      >>> memo = []
+      >>> traverse = lambda base, econtext, call, path_items: path_items
+      >>> static_traverse(
+      ...     memo, traverse, ProxyFactory(modules), {}, False, ('os', ))
+      ('os',)
+      >>> memo
+      []
+    """
+
+    if memo:
+        entry = memo[0]
+        if entry[0] is base:
+            value = entry[1]
+            if call and getattr(value, '__call__', _marker) is not _marker:
+                return value()
+            return value
+
+    if removeSecurityProxy(base) is not base:
+        return traverse(base, econtext, call, path_items)
+
+    value = traverse(base, econtext, False, path_items)
+    memo[:] = [(base, value)]
+
+    if call and getattr(value, '__call__', _marker) is not _marker:
+        return value()
+
+    return value
+
+
+def trusted_path_traverse(base, econtext, call, path_items, cache=None,
+                          default=_marker):
+    """Traverse ``path_items`` from ``base`` without security checks.
+
+    A security proxy around ``base`` is removed once for the entire
+    path, such that the segments are traversed without checker
+    lookups (and the inline cache applies to the actual class); this
+    is only used for trusted templates (see ``TrustedPathExpr``).
+    """
+
+    return path_traverse(
+        removeSecurityProxy(base), econtext, call, path_items, cache,
+        default)
+
+
+def pure_traverse(base, econtext, call, path_items, cache=None,
+                  traverse=path_traverse):
+    """Traverse ``path_items`` from ``base`` (using ``traverse``) once
+    per request (or render) and remember the result (see
+    ``z3c.pt.memo``)."""
+
+    memo = dict.get(econtext, '__path_memo')
+    if memo is None:
+        memo = econtext['__path_memo'] = get_memo(econtext.get('request'))
+
+    key = traverse, id(base), call, path_items
+    entry = memo.results.get(key)
+    if entry is not None and entry[0] is base:
+        memo.hit()
+        return entry[1]
+
+    value = traverse(base, econtext, call, path_items, cache)
+    memo.results[key] = base, value
+    memo.miss()
+    return value
+
+
+def trusted_pure_traverse(base, econtext, call, path_items, cache=None):
+    """Memoizing traverser for trusted templates."""
+
+    return pure_traverse(
+        base, econtext, call, path_items, cache, trusted_path_traverse)
+
+
+def _adapter_only(base, name, default):
+    """Inline cache strategy for segments which were resolved using
+    the ``ITraversable`` adapter."""
+
+    return default
+
+
+def _traverse_element(base, name, path_items, i, request, default=_marker):
+    """Traverse ``name`` using ``traversePathElement`` (or
+    ``probe_element`` if a ``default`` is given).
+
+    The traverser is passed the remaining path (as a reversed list of
+    names) which it is allowed to change; if it does, we continue
+    with a new plan made from whatever is left.
+    """
+
+    if i < len(path_items):
+        further_path = [
+            item if item.__class__ is not tuple else
+            item[1] if item[0] is None else
+            "%s:%s" % item
+            for item in path_items[:i - 1:-1]
+            ]
+        remaining = further_path[:]
+    else:
+        further_path = []
+        remaining = ()
+
+    if default is _marker:
+        base = traversePathElement(base, name, further_path, request=request)
+    else:
+        base = probe_element(base, name, further_path, request, default)
+        if base is default:
+            return base, path_items, i
+
+    if not further_path and not remaining or further_path == remaining:
+        return base, path_items, i
+
+    path_items = tuple((None, item) for item in reversed(further_path))
+    return base, path_items, 0
+
+
+def probe_element(base, name, further_path, request, default):
+    """Traverse ``name`` like ``traversePathElement``, but return
+    ``default`` if it is not found.
+
+    The lookups of the default traversal adapter are repeated here
+    such that a missing name does not raise (and catch) any exception
+    for dictionaries and objects without items; for other adapters,
+    only the ``LocationError`` is caught.
+    """
+
+    if name in ('.', '..') or name and name[:1] in '@+':
+        return traversePathElement(
+            base, name, further_path, default, request=request)
+
+    if not is_default_traversable(base):
+        traversable = ITraversable(base, None)
+        if traversable is None:
+            return default
+
+        try:
+            return traversable.traverse(name, further_path)
+        except LocationError:
+            return default
+
+    next = getattr(base, name, _marker)
+    if next is not _marker:
+        return next
+
+    if base.__class__ is dict:
+        return base.get(name, default)
+
+    if hasattr(base, '__getitem__'):
+        try:
+            return base[name]
+        except (KeyError, TypeError):
+            pass
+
+    return default
+
+
+def is_default_traversable(base):
+    """Return true if ``base`` is adapted to ``ITraversable`` using
+    ``DefaultTraversable``; the answer is cached for the interfaces
+    provided by the object and the current registry."""
+
+    registry = adapter_registry()
+    cls = base.__class__
+
+    # Dictionaries can't provide interfaces of their own
+    key = cls if cls is dict else providedBy(base)
+    entry = default_traversables.get(key)
+    if entry is None or entry[0] != registry:
+        spec = providedBy(base)
+        factory = None
+        if not spec.isOrExtends(ITraversable):
+            factory = registry[0].lookup((spec, ), ITraversable, '')
+        entry = default_traversables[key] = (
+            registry, factory is DefaultTraversable)
+
+    return entry[1]
+
+
+class ExpressionEvaluator(BaseExpressionEvaluator):
+    """Evaluates dynamic expressions (``path('context/title')``).
+
+    Compiled expressions are kept in the bounded, shared
+    ``expression_cache`` keyed on the evaluator, the expression type
+    and the expression source.
+
+      >>> from z3c.pt.pagetemplate import PageTemplate
+      >>> evaluate = PageTemplate("").builtins['tales']
+      >>> from chameleon.utils import Scope
+      >>> econtext = Scope({'context': {'title': 'Hello'}})
+
+      >>> expression_cache.clear()
+      >>> hits, misses = expression_cache.hits, expression_cache.misses
+      >>> for i in range(3):
+      ...     print(evaluate(econtext, {}, 'path', 'context/title'))
+      Hello
+      Hello
+      Hello
+
+      >>> expression_cache.hits - hits, expression_cache.misses - misses
+      (2, 1)
+    """
+
+    __slots__ = ()
+
+    cache = expression_cache
+
+    def __call__(self, econtext, rcontext, expression_type, string=None):
+        if string is None:
+            return partial(self.__call__, econtext, rcontext, expression_type)
+
+        key = self, expression_type, string
+        evaluate = self.cache.get(key)
+        if evaluate is None:
+            evaluate = self.cache[key] = self.compile(expression_type, string)
+
+        evaluate(econtext, rcontext, *self._builtins)
+        return econtext['_result']
+
+    def compile(self, expression_type, string):
+        expression = "%s:%s" % (expression_type, string)
+        assignment = Assignment(["_result"], expression, True)
+        module = Module("evaluate", Context(assignment))
+        compiler = Compiler(
+            self._engine, module, "<string>", string,
+            ('econtext', 'rcontext') + self._names
+            )
+
+        env = {}
+        exec(compiler.code, env)
+        return env["evaluate"]
+
+
+# Traversers which walk a traversal plan (see ``path_traverse``) and
+# support the per-call-site inline cache; other traversers are passed
+# the path segments as strings
+inline_cache_traversers = (
+    path_traverse, trusted_path_traverse,
+    pure_traverse, trusted_pure_traverse,
+    )
+
+
 class ContextExpressionMixin(object):
     """Mixin-class for expression compilers."""
 
@@ -147,6 +661,24 @@ class PathExpr(TalesExpr):
 
     traverser = Symbol(path_traverse)
 
+    # Give each call site an inline cache of traversal strategies (this
+    # requires a traverser which accepts the ``cache`` argument).
+    inline_cache = True
+
+    # Builtins which are loaded directly instead of traversed when
+    # they make up the entire path; the value is still called if it's
+    # callable (the name may be defined in the template).
+    constant_bases = 'nothing',
+
+    # Builtins from which static paths are traversed only once per call
+    # site, e.g. ``modules/os/sep``, unless security proxied (see
+    # ``static_traverse``).
+    static_bases = 'modules',
+
+    # The value of a path which does not exist, instead of an exception
+    # (this requires a traverser which accepts the ``default`` argument).
+    default = None
+
     def translate(self, string, target):
         """
         >>> from chameleon.tales import test
@@ -167,7 +699,12 @@ class PathExpr(TalesExpr):
         # note that unicode paths are not allowed
         parts = str(path).split('/')
 
+        # Whether the traverser walks a traversal plan
+        plan = getattr(self.traverser, 'value', None) in \
+               inline_cache_traversers
+
         components = []
+        static = True
         for part in parts[1:]:
             interpolation_args = []
 
@@ -182,14 +719,21 @@ class PathExpr(TalesExpr):
                 if count == 0:
                     break
 
+            # The traversal plan (see ``path_traverse``); namespaces
+            # are split off here unless the segment is interpolated.
             if len(interpolation_args):
+                static = False
                 component = template(
-                    "format % args", format=ast.Str(part),
+                    plan and "(None, format % args)" or "format % args",
+                    format=ast.Str(part),
                     args=ast.Tuple(
                         list(map(load, interpolation_args)),
                         ast.Load()
                         ),
                     mode="eval")
+            elif plan and ':' in part:
+                component = ast.Tuple(
+                    list(map(ast.Str, part.split(':', 1))), ast.Load())
             else:
                 component = ast.Str(part)
 
@@ -200,9 +744,27 @@ class PathExpr(TalesExpr):
         if not components:
             if len(parts) == 1 and (nocall or base == 'None'):
                 return template("target = base", base=base, target=target)
+            elif len(parts) == 1 and base in self.constant_bases:
+                return template(
+                    "target = base\n"
+                    "if target is not None: target = call(target)",
+                    base=base, target=target, call=Symbol(call_value))
             else:
                 components = ()
 
+        if components and static and base in self.static_bases:
+            value = template(
+                "static(memo, traverse, base, econtext, call, path_items)",
+                static=Symbol(static_traverse),
+                memo=Static(ast.List([], ast.Load())),
+                traverse=self.traverser,
+                base=load(base),
+                call=load(str(not nocall)),
+                path_items=ast.Tuple(elts=components),
+                mode="eval",
+                )
+            return template("target = value", target=target, value=value)
+
         call = template(
             "traverse(base, econtext, call, path_items)",
             traverse=self.traverser,
@@ -212,6 +774,15 @@ class PathExpr(TalesExpr):
             mode="eval",
             )
 
+        if components and self.inline_cache and plan:
+            call.args.append(Static(ast.List(
+                [ast.Dict(keys=[], values=[]) for c in components],
+                ast.Load())))
+
+        if self.default is not None:
+            call.keywords.append(
+                ast.keyword(arg='default', value=self.default))
+
         return template("target = value", target=target, value=call)
 
 
@@ -223,11 +794,108 @@ class NocallExpr(PathExpr):
             "nocall:%s" % expression, engine)
 
 
+class TrustedPathExpr(PathExpr):
+    """A path-expression for trusted templates, which traverses the
+    path without security proxies."""
+
+    traverser = Symbol(trusted_path_traverse)
+
+
+class TrustedNocallExpr(NocallExpr, TrustedPathExpr):
+    """A path-expression for trusted templates which does not call the
+    resolved object."""
+
+
+class PureExpr(PathExpr):
+    """A path-expression whose result is remembered for the request
+    (see ``z3c.pt.memo``); use it for paths which evaluate to the same
+    result for as long as the page renders."""
+
+    traverser = Symbol(pure_traverse)
+
+
+class TrustedPureExpr(PureExpr):
+    """A pure path-expression for trusted templates."""
+
+    traverser = Symbol(trusted_pure_traverse)
+
+
+class ProbeExpr(NocallExpr):
+    """A path-expression which evaluates to ``MISSING_MARKER`` if the
+    path does not exist; the path is probed without raising an
+    exception for the missing segment (see ``probe_element``)."""
+
+    default = Symbol(MISSING_MARKER)
+
+    constant_bases = static_bases = ()
+
+
+class TrustedProbeExpr(ProbeExpr, TrustedNocallExpr):
+    """A probing path-expression for trusted templates."""
+
+
 class ExistsExpr(BaseExistsExpr):
     exceptions = AttributeError, LookupError, TypeError, KeyError, NameError
 
+    # Plain paths are checked using a probing traverser, such that a
+    # missing segment does not raise an exception; this is done only if
+    # the ``nocall`` expression type of the engine is ``nocall`` (the
+    # path would otherwise be traversed differently)
+    probe = ProbeExpr
+    nocall = NocallExpr
+
     def __init__(self, expression):
         super(ExistsExpr, self).__init__("nocall:" + expression)
+        self.path = expression.strip()
+
+    def __call__(self, target, engine):
+        m = PathExpr.path_regex.match(self.path)
+        if m is None or m.group(1) is not None or '/' not in self.path or \
+               self.get_nocall(engine) is not self.nocall:
+            return super(ExistsExpr, self).__call__(target, engine)
+
+        ignore = store("_ignore")
+        return [
+            TryExcept(
+                body=self.probe(self.path)(ignore, engine),
+                handlers=[ast.ExceptHandler(
+                    type=ast.Tuple(
+                        elts=list(map(resolve_global, self.exceptions)),
+                        ctx=ast.Load()),
+                    name=None,
+                    body=template("target = 0", target=target),
+                    )],
+                orelse=template(
+                    "target = 0 if value is missing else 1",
+                    target=target, value=ignore,
+                    missing=Symbol(MISSING_MARKER))
+            )
+        ]
+
+    @staticmethod
+    def get_nocall(engine):
+        """Return the ``nocall`` expression type of the engine (or
+        ``None`` if unknown)."""
+
+        parser = getattr(engine, '_parser', None)
+        factory = getattr(parser, 'factories', {}).get('nocall')
+
+        # Expression types are wrapped if profiled
+        return getattr(factory, 'expression_type', factory)
+
+
+class TrustedExistsExpr(ExistsExpr):
+    probe = TrustedProbeExpr
+    nocall = TrustedNocallExpr
+
+
+# Expression types which are replaced in trusted templates
+trusted_expressions = {
+    PathExpr: TrustedPathExpr,
+    NocallExpr: TrustedNocallExpr,
+    ExistsExpr: TrustedExistsExpr,
+    PureExpr: TrustedPureExpr,
+    }
 
 
 class ProviderExpr(ContextExpressionMixin, StringExpr):
@@ -244,22 +912,32 @@ class PythonExpr(BasePythonExpr):
          for name in ('path', 'exists')
         )
 
+    # The compiler which resolves names (if any), see ``z3c.pt.names``
+    names = None
+
     def __init__(self, expression):
         self.expression = expression
 
     def __call__(self, target, engine):
+        self.names = getattr(engine, 'names', None)
         return self.translate(self.expression, target)
 
     def rewrite(self, node):
         builtin = self.builtins.get(node.id)
         if builtin is not None:
-            return template(
+            fallback = template(
                 "get(name) if get(name) is not None else builtin",
                 get=Builtin("get"),
                 name=ast.Str(s=node.id),
                 builtin=builtin,
                 mode="eval"
                 )
+        else:
+            fallback = None
+
+        if self.names is not None:
+            return self.names.resolve(node, fallback, builtin)
+        return fallback
 
     @property
     def transform(self):
@@ -0,0 +1,223 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Cache the output of content providers and macros.
+
+A content provider opts in by providing a ``fragment_key`` method,
+which is called (after the provider has been looked up, but before it
+is updated) to compute a key for its output from its inputs, and
+optionally a ``fragment_ttl`` (in seconds). If the key is not
+``None`` and the output is in the cache, it is inserted without
+calling ``update()`` or ``render()``.
+
+A macro opts in by the template which defines it, using the
+``cached_macros`` option, which maps macro names to a key function
+(called with the execution context of the macro) and a time-to-live::
+
+  PageTemplateFile('layout.pt', cached_macros={
+      'portlet': (lambda econtext: econtext['context'].id, 60)})
+
+Note that the output of a macro includes the slots filled by the
+caller; the key must account for them.
+
+The output is kept in ``fragment_cache``, which uses an in-memory LRU
+cache by default; any object with ``get(key)``, ``set(key, value,
+ttl)`` and ``clear()`` methods may be used as its backend:
+
+  >>> cache = FragmentCache()
+  >>> key = cache.key('provider', 'viewlet', 42)
+  >>> cache.get(key) is None
+  True
+  >>> cache.set(key, u"<p>Output</p>")
+  >>> print(cache.get(key))
+  <p>Output</p>
+
+Entries are invalidated by name (the provider or macro name) or all
+at once:
+
+  >>> cache.invalidate('viewlet')
+  >>> cache.get(cache.key('provider', 'viewlet', 42)) is None
+  True
+
+  >>> sorted(cache.stats().items())
+  [('hit_rate', 0.33...), ('hits', 1), ('misses', 2), ('stores', 1)]
+"""
+import time
+import hashlib
+
+from z3c.pt.cache import LRUCache
+
+
+class MemoryBackend(object):
+    """Keeps at most ``maxsize`` fragments in memory."""
+
+    def __init__(self, maxsize=1000):
+        self.entries = LRUCache(maxsize)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires, value = entry
+        if expires is not None and expires < time.time():
+            self.entries.pop(key, None)
+            return None
+
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires = ttl is not None and time.time() + ttl or None
+        self.entries[key] = expires, value
+
+    def clear(self):
+        self.entries.clear()
+
+
+class FragmentCache(object):
+    """Cache of rendered fragments, which counts hits and misses."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+        self.generations = {}
+        self.generation = 0
+        self.hits = self.misses = self.stores = 0
+
+    def key(self, kind, name, key):
+        """Return the backend key for the fragment of kind
+        ("provider" or "macro") and name with key
+        key."""
+
+        return (kind, name, self.generation,
+                self.generations.get(name, 0), key)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+        self.stores += 1
+
+    def invalidate(self, name=None):
+        """Invalidate the fragments of ``name`` (or all fragments).
+
+        The entries are not removed from the backend, but will no
+        longer be found.
+        """
+
+        if name is None:
+            self.generation += 1
+        else:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = self.stores = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': lookups and float(self.hits) / lookups or 0.0,
+            }
+
+
+fragment_cache = FragmentCache()
+
+
+class CachingProvider(object):
+    """Stores the output of a content provider when it is rendered."""
+
+    __slots__ = 'cp', 'key', 'ttl'
+
+    def __init__(self, cp, key, ttl):
+        self.cp = cp
+        self.key = key
+        self.ttl = ttl
+
+    def render(self):
+        output = self.cp.render()
+
+        # The output of asynchronous providers is not cached
+        if not hasattr(output, '__await__'):
+            fragment_cache.set(self.key, output, self.ttl)
+
+        return output
+
+
+def provider_key(cp, name):
+    """Return the cache key for the output of content provider ``cp``,
+    or ``None`` if it is not cached."""
+
+    fragment_key = getattr(cp, 'fragment_key', None)
+    if fragment_key is None:
+        return None
+
+    key = fragment_key()
+    if key is None:
+        return None
+
+    return fragment_cache.key('provider', name, key)
+
+
+def cached_macro(render, namespace, name, key, ttl):
+    """Wrap the render function of a macro such that its output is
+    served from (and stored in) the fragment cache."""
+
+    def include(stream, econtext, rcontext, *args):
+        value = key(econtext)
+
+        # The output is taken from the stream when the macro is done;
+        # this is not possible for a stream which is sent in chunks.
+        if value is None or stream.__class__ is not list:
+            return render(stream, econtext, rcontext, *args)
+
+        cache_key = fragment_cache.key('macro', name, (namespace, value))
+        output = fragment_cache.get(cache_key)
+        if output is not None:
+            stream.append(output)
+            return
+
+        start = len(stream)
+        render(stream, econtext, rcontext, *args)
+        fragment_cache.set(cache_key, u"".join(stream[start:]), ttl)
+
+    return include
+
+
+def cache_macros(template, body):
+    """Set up the macros of ``template`` declared in its
+    ``cached_macros`` option (see above)."""
+
+    # Inline templates are told apart by their source
+    namespace = template.filename
+    if not namespace or namespace.startswith('<'):
+        namespace = hashlib.sha1(body.encode('utf-8', 'ignore')).hexdigest()
+
+    for name, (key, ttl) in template.cached_macros.items():
+        attribute = "_render_%s" % name.replace('-', '_')
+        render = getattr(template, attribute, None)
+        if render is None:
+            raise KeyError("Macro does not exist: '%s'." % name)
+
+        setattr(template, attribute,
+                cached_macro(render, namespace, name, key, ttl))
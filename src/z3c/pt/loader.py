@@ -11,11 +11,145 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import os
+import glob
+import marshal
+import logging
+import threading
+import multiprocessing
+
 from z3c.pt.pagetemplate import PageTemplateFile
+from z3c.pt.precompile import find_templates
+from z3c.pt.precompile import package_path
 
 from chameleon import loader
 
+log = logging.getLogger('z3c.pt')
+
 
 class TemplateLoader(loader.TemplateLoader):
+    """Template loader; keyword arguments such as ``watch=True`` (see
+    ``z3c.pt.watch``) are passed on to the template class.
+
+    Templates are loaded by one thread at a time, such that threads
+    which load the same template at once get the same instance (which
+    is then cooked once, see ``BaseTemplateFile.cook_check``)."""
+
+    def __init__(self, *args, **kwargs):
+        super(TemplateLoader, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+
+    def load(self, *args, **kwargs):
+        template = self.registry.get(args)
+        if template is None:
+            with self._lock:
+                template = super(TemplateLoader, self).load(*args, **kwargs)
+        return template
+
     def load_page(self, filename):
         return self.load(filename, PageTemplateFile)
+
+    def find(self, specs, extension=".pt"):
+        """Yield the template files matching ``specs``.
+
+        A spec is a filename or directory (relative paths are looked up
+        in the search path) or a glob pattern, optionally prefixed with
+        a package name and a colon, e.g. ``"my.package:templates/*.pt"``.
+        """
+
+        for spec in specs:
+            if ':' in spec and not os.path.exists(spec):
+                name, spec = spec.split(':', 1)
+                paths = [package_path(name)]
+            elif os.path.isabs(spec):
+                paths = ['']
+            else:
+                paths = self.search_path or [os.curdir]
+
+            for path in paths:
+                for filename in sorted(glob.glob(os.path.join(path, spec))):
+                    if os.path.isdir(filename):
+                        for filename in find_templates((filename, ),
+                                                       extension):
+                            yield os.path.abspath(filename)
+                    else:
+                        yield os.path.abspath(filename)
+
+    def warm_up(self, specs, processes=None, cls=PageTemplateFile):
+        """Compile the templates matching ``specs`` (see ``find``) in a
+        pool of ``processes`` worker processes (by default, one for
+        each CPU) and load the compiled templates into the template
+        cache of ``cls``.
+
+        Call this before forking worker processes, such that they
+        share the compiled templates. Returns the lists of compiled
+        and failed filenames.
+        """
+
+        filenames = []
+        for filename in self.find(specs):
+            if filename not in filenames:
+                filenames.append(filename)
+
+        tasks = [(filename, cls, self.kwargs) for filename in filenames]
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        if processes > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+            try:
+                chunksize = max(1, len(tasks) // (processes * 4))
+                results = pool.map(compile_template, tasks, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(compile_template, tasks)
+
+        compiled, failed = [], []
+        for filename, programs in results:
+            if programs is None:
+                failed.append(filename)
+                continue
+
+            for name, code in programs:
+                cls.loader.load(name, code)
+            compiled.append(filename)
+
+        return compiled, failed
+
+
+class RecordingLoader(object):
+    """Loader which keeps the byte-code of the templates it builds;
+    templates in memory already are not compiled again."""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.programs = []
+
+    def get(self, name):
+        if name in self.loader.programs:
+            return self.loader.get(name)
+
+    def build(self, source, name):
+        code = compile(source, name, 'exec')
+        self.programs.append((name, marshal.dumps(code)))
+        return self.loader.load(name, code)
+
+
+def compile_template(args):
+    """Compile a template file; returns the filename and a list of the
+    names and marshalled byte-code of the compiled programs (or
+    ``None`` if the template failed to compile)."""
+
+    filename, cls, kwargs = args
+    try:
+        template = cls(filename, **kwargs)
+        template.loader = recorder = RecordingLoader(cls.loader)
+        template.cook_check()
+    except Exception:
+        log.debug("unable to compile %s." % filename, exc_info=True)
+        return filename, None
+
+    return filename, recorder.programs
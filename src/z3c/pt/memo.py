@@ -0,0 +1,102 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Remember the results of pure path-expressions.
+
+A ``pure:`` path-expression is traversed (and its result called)
+only once per request for a given base object; the result is shared
+by all templates rendered for the request. This is meant for paths
+such as ``context/title`` or ``view/portal_url`` which are evaluated
+many times by layouts and macros and whose result does not change
+while the page is rendered.
+
+The results are kept in the request annotations (if available);
+otherwise, for the duration of a render:
+
+  >>> from z3c.pt.pagetemplate import PageTemplate
+  >>> template = PageTemplate('''\\
+  ... <div tal:repeat="i python: range(3)">${pure: options/title}</div>''')
+
+  >>> class Title(object):
+  ...     calls = 0
+  ...     def __call__(self):
+  ...         self.calls += 1
+  ...         return u"Title"
+
+  >>> reset()
+  >>> title = Title()
+  >>> print(template(title=title))
+  <div>Title</div>
+  <div>Title</div>
+  <div>Title</div>
+  >>> title.calls
+  1
+
+The number of traversals saved (the hits) is counted for each memo
+and in total:
+
+  >>> sorted(stats().items())
+  [('hits', 2), ('misses', 1)]
+"""
+_totals = {'hits': 0, 'misses': 0}
+
+# Request annotation key
+KEY = 'z3c.pt.memo'
+
+
+class PathMemo(object):
+    """Results of path-expressions by traverser, base object (which
+    is kept alive by the memo), call flag and path (see
+    ``z3c.pt.expressions.pure_traverse``)."""
+
+    __slots__ = 'results', 'hits', 'misses'
+
+    def __init__(self):
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+        _totals['hits'] += 1
+
+    def miss(self):
+        self.misses += 1
+        _totals['misses'] += 1
+
+
+def get_memo(request):
+    """Return the memo for ``request``; it is kept in the request
+    annotations (if available) and shared by all templates rendered
+    for the request."""
+
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return PathMemo()
+
+    memo = annotations.get(KEY)
+    if memo is None:
+        memo = annotations[KEY] = PathMemo()
+
+    return memo
+
+
+def stats():
+    """Return the total number of hits (traversals saved) and misses
+    of all memos."""
+
+    return dict(_totals)
+
+
+def reset():
+    _totals['hits'] = _totals['misses'] = 0
@@ -0,0 +1,361 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Resolve the names of Python-expressions when the template is compiled.
+
+Names in a Python-expression are otherwise looked up in the dynamic
+context each time the expression is evaluated. Instead, the variables
+defined (locally) in the template and the loop variables of a repeat
+are kept in local variables of the compiled program, while the other
+names which are used in a loop (or more than once) are looked up once
+each time the template (or macro) is rendered:
+
+  >>> from z3c.pt.pagetemplate import PageTemplate
+  >>> template = PageTemplate('''\\
+  ... <table tal:define="columns python: ('a', 'b')">
+  ...   <tr tal:repeat="row python: options['rows']">
+  ...     <td tal:repeat="column columns"
+  ...         tal:content="python: row[column] * options['factor']" />
+  ...   </tr>
+  ... </table>''', keep_source=True)
+
+  >>> print(template(rows=[{'a': 1, 'b': 2}], factor=10))
+  <table>
+    <tr>
+      <td>10</td>
+      <td>20</td>
+    </tr>
+  </table>
+
+  >>> "getname('row')" in template.source
+  False
+  >>> "getname('column')" in template.source
+  False
+  >>> template.source.count("econtext.get('options'")
+  1
+
+The names are looked up in the dynamic context as before in a function
+of the program which includes a macro or code block, since these may
+define any name; this also applies to names which are defined
+globally, or by a list comprehension.
+
+The compiler relies on some of the internals of Chameleon's compiler
+(the aliases of the local variables and the names it reserves, and the
+variables it assigns the value of a define and the item of a repeat
+to); each of these is checked for, and names are looked up in the
+dynamic context if one is not available.
+"""
+import ast
+
+from chameleon.astutil import load
+from chameleon.astutil import node_annotations
+from chameleon.astutil import Symbol
+from chameleon.codegen import template
+from chameleon.compiler import Compiler
+from chameleon.compiler import identifier
+from chameleon.utils import ImportableMarker
+
+# The value of a name which is not defined in the dynamic context
+UNDEFINED_MARKER = ImportableMarker(__name__, "UNDEFINED")
+
+
+def uses_name(nodes, name):
+    """Return true if the variable ``name`` is used in ``nodes``."""
+
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name) and child.id == name:
+                return True
+    return False
+
+
+class Frame(object):
+    """The names resolved in a function of the compiled program."""
+
+    def __init__(self):
+        # Each scope maps the local variables of the template to the
+        # names they're kept in
+        self.scopes = [{}]
+
+        # Names which are assigned to in the dynamic context
+        self.assigned = set()
+
+        # Number of loops entered; the names used in a loop are looked
+        # up once (before the loop)
+        self.loops = 0
+
+        # If set, names are looked up in the dynamic context
+        self.opaque = False
+
+        self.names = []
+        self.uses = {}
+
+
+class NameResolvingCompiler(Compiler):
+    """Compiler which resolves the names of Python-expressions (see
+    ``PythonExpr.rewrite``) in each function of the program."""
+
+    def __init__(self, engine_factory, *args, **kwargs):
+        # The template is compiled by the base class constructor
+        self.resolve_names = kwargs.pop('resolve_names', True)
+        self._frames = []
+        self._pending = {}
+
+        if self.resolve_names:
+            def factory(*args, **kwargs):
+                engine = engine_factory(*args, **kwargs)
+                engine.names = self
+                return engine
+        else:
+            factory = engine_factory
+
+        super(NameResolvingCompiler, self).__init__(factory, *args, **kwargs)
+
+    @property
+    def frame(self):
+        if self._frames:
+            return self._frames[-1]
+
+    def resolve(self, node, fallback=None, default=None):
+        """Return the expression for the name ``node``, or
+        ``fallback`` (if not ``None``) to look it up in the dynamic
+        context; ``default`` is the value of the name if undefined."""
+
+        frame = self.frame
+        name = node.id
+        if frame is None or name.startswith('__'):
+            return fallback
+
+        # The dynamic context may be changed by the expression
+        if name in ('econtext', 'rcontext'):
+            frame.opaque = True
+            return fallback
+
+        if not isinstance(node.ctx, ast.Load):
+            frame.assigned.add(name)
+            return fallback
+
+        # The names reserved by the compiler, and the (compiler)
+        # aliases of the variables of macros and blocks
+        transform = getattr(getattr(self, '_visitor', None), 'transform', None)
+        internals = getattr(transform, 'internals', None)
+        builtins = getattr(transform, 'builtins', None)
+        aliases = getattr(self, '_aliases', None)
+        if internals is None or builtins is None or not aliases:
+            return fallback
+
+        if name in internals or aliases[-1].get(name) is not None:
+            return fallback
+
+        if fallback is None:
+            fallback = transform(node)
+
+        alias = frame.scopes[-1].get(name)
+        if alias is not None:
+            kind = 'local'
+        else:
+            alias = identifier('name_%s' % name, id(frame))
+            if default is not None:
+                kind = 'default'
+            elif name in builtins:
+                kind = 'builtin'
+            else:
+                kind = 'name'
+
+            use = frame.uses.setdefault(name, [0, False])
+            use[0] += 1
+            if frame.loops:
+                use[1] = True
+
+        placeholder = load(alias)
+        frame.names.append((name, placeholder, fallback, kind, default))
+        return placeholder
+
+    def _finalize(self, frame):
+        """Return the statements which look up the names of ``frame``
+        (once) and resolve the names used."""
+
+        hoisted = {}
+        for name, placeholder, fallback, kind, default in frame.names:
+            if frame.opaque or name in frame.assigned:
+                node_annotations[placeholder] = fallback
+                continue
+
+            if kind == 'local':
+                continue
+
+            count, loop = frame.uses[name]
+            if count < 2 and not loop:
+                node_annotations[placeholder] = fallback
+                continue
+
+            alias = placeholder.id
+            key = ast.Str(s=name)
+            if kind == 'builtin':
+                stmts = template(
+                    "ALIAS = econtext.get(KEY, NAME)",
+                    ALIAS=alias, KEY=key, NAME=load(name))
+            elif kind == 'default':
+                stmts = template(
+                    "ALIAS = econtext.get(KEY)\n"
+                    "if ALIAS is None: ALIAS = DEFAULT",
+                    ALIAS=alias, KEY=key, DEFAULT=default)
+            else:
+                stmts = template(
+                    "ALIAS = econtext.get(KEY, UNDEFINED)",
+                    ALIAS=alias, KEY=key, UNDEFINED=Symbol(UNDEFINED_MARKER))
+
+                # An undefined name is an error only if evaluated
+                node_annotations[placeholder] = template(
+                    "ALIAS if ALIAS is not UNDEFINED else getname(KEY)",
+                    ALIAS=alias, KEY=key, UNDEFINED=Symbol(UNDEFINED_MARKER),
+                    mode="eval")
+
+            hoisted[name] = stmts
+
+        body = []
+        for name in sorted(hoisted):
+            body += hoisted[name]
+        return body
+
+    def visit(self, node):
+        repeat = node is not None and self._pending.pop(id(node), None)
+        if not repeat:
+            return super(NameResolvingCompiler, self).visit(node)
+
+        # The body of a repeat
+        repeat, aliases, items = repeat
+        frame = self.frame
+        scope = dict(frame.scopes[-1])
+        scope.update(aliases)
+        frame.scopes.append(scope)
+        frame.loops += 1
+        try:
+            body = super(NameResolvingCompiler, self).visit(node)
+        finally:
+            frame.loops -= 1
+            frame.scopes.pop()
+
+        # The item is assigned once the repeat is compiled (see
+        # ``visit_Repeat``)
+        stmts = []
+        for name in repeat.names:
+            item = load('__item_%s' % aliases[name])
+            items.append((item, name))
+            stmts += template("ALIAS = ITEM", ALIAS=aliases[name], ITEM=item)
+
+        return stmts + body
+
+    def visit_Context(self, node):
+        if not self.resolve_names:
+            return super(NameResolvingCompiler, self).visit_Context(node)
+
+        frame = Frame()
+        self._frames.append(frame)
+        try:
+            body = super(NameResolvingCompiler, self).visit_Context(node)
+        finally:
+            self._frames.pop()
+
+        return self._finalize(frame) + body
+
+    def visit_Define(self, node):
+        frame = self.frame
+        if frame is None:
+            return super(NameResolvingCompiler, self).visit_Define(node)
+
+        frame.scopes.append(dict(frame.scopes[-1]))
+        try:
+            return list(super(NameResolvingCompiler, self).visit_Define(node))
+        finally:
+            frame.scopes.pop()
+
+    def visit_Assignment(self, node):
+        body = super(NameResolvingCompiler, self).visit_Assignment(node)
+        frame = self.frame
+        if frame is None:
+            return body
+
+        if not node.local:
+            frame.assigned.update(node.names)
+            return body
+
+        # The value is kept in ``__value`` by the compiler
+        value = len(node.names) == 1 and uses_name(body, '__value')
+
+        scope = frame.scopes[-1]
+        for name in node.names:
+            alias = scope[name] = identifier('local_%s' % name, id(node))
+            if value:
+                body += template("ALIAS = __value", ALIAS=alias)
+            else:
+                body += template(
+                    "ALIAS = getname(KEY)", ALIAS=alias, KEY=ast.Str(s=name))
+
+        return body
+
+    def visit_Repeat(self, node):
+        frame = self.frame
+        if frame is None:
+            return super(NameResolvingCompiler, self).visit_Repeat(node)
+
+        if not node.local or node.node is None:
+            frame.assigned.update(node.names)
+            return super(NameResolvingCompiler, self).visit_Repeat(node)
+
+        # The loop variables are defined in the body (see ``visit``)
+        aliases = dict(
+            (name, identifier('local_%s' % name, id(node)))
+            for name in node.names)
+        items = []
+        self._pending[id(node.node)] = node, aliases, items
+        try:
+            body = super(NameResolvingCompiler, self).visit_Repeat(node)
+        finally:
+            self._pending.pop(id(node.node), None)
+
+        # The item is kept in ``__item`` by the compiler
+        item = len(node.names) == 1 and uses_name(body, '__item')
+        for placeholder, name in items:
+            node_annotations[placeholder] = item and load('__item') or \
+                template("getname(KEY)", KEY=ast.Str(s=name), mode="eval")
+
+        return body
+
+    def visit_OnError(self, node):
+        frame = self.frame
+        if frame is not None:
+            frame.assigned.add(node.name)
+        return super(NameResolvingCompiler, self).visit_OnError(node)
+
+    def visit_CodeBlock(self, node):
+        frame = self.frame
+        if frame is not None:
+            frame.opaque = True
+        return super(NameResolvingCompiler, self).visit_CodeBlock(node)
+
+    # The dynamic context is updated when a macro is used
+
+    def visit_UseInternalMacro(self, node):
+        body = super(NameResolvingCompiler, self).visit_UseInternalMacro(node)
+        frame = self.frame
+        if frame is not None:
+            frame.opaque = True
+        return body
+
+    def visit_UseExternalMacro(self, node):
+        body = super(NameResolvingCompiler, self).visit_UseExternalMacro(node)
+        frame = self.frame
+        if frame is not None:
+            frame.opaque = True
+        return body
@@ -12,8 +12,12 @@
 #
 ##############################################################################
 import zope.component
+from zope.interface import providedBy
 from zope.traversing.interfaces import IPathAdapter
 
+from z3c.pt.cache import adapter_registry
+from z3c.pt.cache import clear_on_registry_change
+
 class AdapterNamespaces(object):
     """Simulate tales function namespaces with adapter lookup.
 
@@ -39,19 +43,67 @@ class AdapterNamespaces(object):
       Traceback (most recent call last):
       ...
       KeyError: 'a2'
+
+    The adapter factory is looked up once for the interfaces provided
+    by the object; registering an adapter clears the cache:
+
+      >>> class IExample(zope.interface.Interface):
+      ...     pass
+      >>> @zope.interface.implementer(IExample)
+      ... class Example(object):
+      ...     pass
+      >>> example = Example()
+      >>> namespaces['a1'](example)
+      1
+      >>> len(namespaces.factories['a1'])
+      2
+
+      >>> def adapter2(ob):
+      ...     return 2
+      >>> zope.component.getGlobalSiteManager().registerAdapter(
+      ...     adapter2, [IExample], IPathAdapter, 'a1')
+      >>> namespaces.factories['a1']
+      {}
+      >>> namespaces['a1'](example)
+      2
+      >>> namespaces['a1'](ob)
+      1
+
+    Registrations made without an event are noticed as well:
+
+      >>> zope.component.provideAdapter(
+      ...     adapter1, [IExample], IPathAdapter, 'a1')
+      >>> namespaces['a1'](example)
+      1
     """
 
     def __init__(self):
         self.namespaces = {}
+        self.factories = {}
 
     def __getitem__(self, name):
         namespace = self.namespaces.get(name)
         if namespace is None:
+            factories = self.factories[name] = clear_on_registry_change({})
+
             def namespace(object):
-                try:
-                    return zope.component.getAdapter(object, IPathAdapter, name)
-                except zope.component.ComponentLookupError:
-                    raise KeyError(name)
+                # The adapter factory is cached by the interfaces
+                # provided by the object for the current adapter
+                # registry; the cache is cleared on registry changes.
+                registry = adapter_registry()
+                spec = providedBy(object)
+                entry = factories.get(spec)
+                if entry is None or entry[0] != registry:
+                    factory = registry[0].lookup((spec, ), IPathAdapter, name)
+                    entry = factories[spec] = registry, factory
+
+                factory = entry[1]
+                if factory is not None:
+                    adapter = factory(object)
+                    if adapter is not None:
+                        return adapter
+
+                raise KeyError(name)
 
             self.namespaces[name] = namespace
         return namespace
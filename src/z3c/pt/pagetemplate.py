@@ -11,26 +11,35 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import itertools
 import os
 import six
 import sys
+import threading
+import weakref
 
-from zope import i18n
 from zope.security.proxy import ProxyFactory
 
-from chameleon.i18n import fast_translate
+from chameleon.nodes import Module
+from chameleon.template import pkg_digest
 from chameleon.zpt import template
 from chameleon.tales import StringExpr
 from chameleon.tales import NotExpr
-from chameleon.compiler import ExpressionEvaluator
+from chameleon.tales import ExpressionParser
 
 from z3c.pt import expressions
-
-try:
-    from Missing import MV
-    MV  # pyflakes
-except ImportError:
-    MV = object()
+from z3c.pt import fragment
+from z3c.pt import profile
+from z3c.pt import variants
+from z3c.pt.cache import persistent_loader
+from z3c.pt.cache import TemplateCache
+from z3c.pt.names import NameResolvingCompiler
+from z3c.pt.stream import pop_stream
+from z3c.pt.stream import render_chunks
+from z3c.pt.translation import get_translator
+from z3c.pt.translation import MemoizingTranslator
+from z3c.pt.translation import Translator
+from z3c.pt.watch import get_watcher
 
 _marker = object()
 
@@ -66,6 +75,89 @@ class OpaqueDict(dict):
 
 sys_modules = ProxyFactory(OpaqueDict(sys.modules))
 
+# Compiled templates are kept on disk in this directory if set (see
+# ``z3c.pt.precompile``)
+CACHE_DIRECTORY = os.environ.get('Z3C_PT_CACHE_DIRECTORY')
+
+default_stream_factory = template.PageTemplate.output_stream_factory
+
+# Template files are watched for changes by default if set (see
+# ``z3c.pt.watch``)
+WATCH = bool(os.environ.get('Z3C_PT_WATCH'))
+
+# Templates are compiled with profiled expressions by default if set
+# (see ``z3c.pt.profile``)
+PROFILE = bool(os.environ.get('Z3C_PT_PROFILE'))
+
+# Compiled templates shared by all template classes
+template_cache = TemplateCache(loader=(
+    CACHE_DIRECTORY and persistent_loader(CACHE_DIRECTORY) or
+    template.PageTemplate.loader))
+
+# Directories of packages and modules by name
+_package_paths = {}
+
+# Builtins shared between templates with the same engine configuration
+_builtins_cache = {}
+
+
+# Serial numbers of the classes and functions which can't be imported
+# by their name (e.g. defined in a function)
+_serials = weakref.WeakKeyDictionary()
+_serial_counter = itertools.count(1)
+
+
+def digest_name(value):
+    """Return the dotted name of a class or function; if it can't be
+    imported by that name, a serial number is appended which tells it
+    apart from other objects of the same name (in this process)."""
+
+    module = value.__module__
+    name = getattr(value, '__qualname__', value.__name__)
+    ob = sys.modules.get(module)
+    for part in name.split('.'):
+        ob = getattr(ob, part, None)
+
+    name = "%s.%s" % (module, name)
+    if ob is value:
+        return name
+
+    try:
+        serial = _serials.get(value)
+        if serial is None:
+            serial = _serials.setdefault(value, next(_serial_counter))
+    except TypeError:
+        serial = "0x%x" % id(value)
+    return "%s#%s" % (name, serial)
+
+
+def digest_value(value):
+    """Return a string representation of a configuration value which is
+    stable between processes."""
+
+    if isinstance(value, dict):
+        return repr(sorted(
+            (key, digest_value(v)) for key, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value))
+    if hasattr(value, '__name__') and hasattr(value, '__module__'):
+        return digest_name(value)
+    return repr(value)
+
+
+def package_path(name):
+    """Return the directory of the (imported) package or module."""
+
+    path = _package_paths.get(name)
+    if path is None:
+        module = sys.modules[name]
+        try:
+            path = module.__path__[0]
+        except AttributeError:
+            path = os.path.dirname(module.__file__)
+        _package_paths[name] = path
+    return path
+
 
 class DummyRegistry(object):
     """This class is for B/W with Chameleon 1.x API."""
@@ -81,6 +173,22 @@ class BaseTemplate(template.PageTemplate):
 
     registry = DummyRegistry()
 
+    loader = template_cache
+
+    # Attributes which affect the compiled template (in addition to
+    # its filename and source); the class is included only if it's not
+    # one of the classes of this module, such that these share
+    # templates with the same configuration.
+    digest_attributes = (
+        'mode', 'content_type', 'default_expression', 'expression_types',
+        'literal_false', 'strict', 'trim_attribute_space',
+        'boolean_attributes', 'implicit_i18n_translate',
+        'implicit_i18n_attributes', 'enable_data_attributes',
+        'enable_comment_interpolation', 'restricted_namespace',
+        'tokenizer', 'profile', 'trusted', 'variant_language',
+        'resolve_names',
+        )
+
     expression_types = {
         'python': expressions.PythonExpr,
         'string': StringExpr,
@@ -89,6 +197,7 @@ class BaseTemplate(template.PageTemplate):
         'path': expressions.PathExpr,
         'provider': expressions.ProviderExpr,
         'nocall': expressions.NocallExpr,
+        'pure': expressions.PureExpr,
         }
 
     default_expression = "path"
@@ -99,6 +208,48 @@ class BaseTemplate(template.PageTemplate):
 
     trim_attribute_space = True
 
+    # If set, content providers are all updated before any of them is
+    # rendered (see ``expressions.ProviderBatch``).
+    batch_providers = False
+
+    # Default size (in characters) of the chunks yielded by
+    # ``render_iter``
+    chunk_size = 8192
+
+    # If set, translations are remembered for the duration of the
+    # request (see ``z3c.pt.translation``)
+    memoize_translations = False
+
+    # If set, the template is compiled with expressions which record
+    # their number of calls and time spent (see ``z3c.pt.profile``)
+    profile = PROFILE
+
+    # If set, the template is trusted: the ``modules`` builtin is not
+    # security proxied and paths are traversed without security checks
+    # (security proxies are removed from the base object of a path)
+    trusted = False
+
+    # Macros whose output is cached, mapping the macro name to a key
+    # function and time-to-live (see ``z3c.pt.fragment``)
+    cached_macros = None
+
+    # Target languages for which a variant of the template is compiled
+    # with its static messages translated (see ``z3c.pt.variants``)
+    languages = None
+
+    # The target language of a compiled variant
+    variant_language = None
+
+    # If set, the names of Python-expressions are resolved when the
+    # template is compiled (see ``z3c.pt.names``)
+    resolve_names = True
+
+    # Expression types which are profiled
+    profiled_expressions = (
+        expressions.PathExpr, expressions.ProviderExpr,
+        expressions.PythonExpr,
+        )
+
     @property
     def boolean_attributes(self):
         if self.content_type == 'text/xml':
@@ -108,49 +259,114 @@ class BaseTemplate(template.PageTemplate):
 
     @property
     def builtins(self):
-        builtins = {
-            'nothing': None,
-            'modules': sys_modules,
-            }
-
-        tales = ExpressionEvaluator(self.engine, builtins)
-        builtins['tales'] = tales
+        # The builtins are memoized on the instance for as long as the
+        # engine configuration stays the same; cooking the template
+        # again drops the memo (see ``cook``).
+        expression_types = self.expression_types
+        cached = self.__dict__.get('_v_builtins')
+        if cached is not None and cached[0] is expression_types and \
+               cached[1] == self.default_expression:
+            return cached[2]
+
+        key = self._engine_key()
+        builtins = _builtins_cache.get(key)
+        if builtins is None:
+            builtins = {
+                'nothing': None,
+                'modules': self.trusted and sys.modules or sys_modules,
+                }
+
+            tales = expressions.ExpressionEvaluator(self.engine, builtins)
+            builtins['tales'] = tales
+            builtins = _builtins_cache.setdefault(key, builtins)
+
+        self.__dict__['_v_builtins'] = (
+            expression_types, self.default_expression, builtins)
 
         return builtins
 
-    def bind(self, ob, request=None):
-        def render(request=request, **kwargs):
-            context = self._pt_get_context(ob, request, kwargs)
-            return self.render(**context)
+    def _engine_key(self):
+        """Return a hashable key for the expression engine
+        configuration; templates which share it also share their
+        builtins (including the ``tales`` evaluator and its cache of
+        compiled expressions)."""
+
+        return (
+            self.default_expression,
+            self.default_marker,
+            tuple(sorted(self.expression_types.items())),
+            self.profile,
+            self.trusted,
+            )
 
-        return BoundPageTemplate(self, render)
+    @property
+    def expression_parser(self):
+        expression_types = self.expression_types
+        if self.trusted:
+            trusted = expressions.trusted_expressions
+            expression_types = dict(
+                (name, trusted.get(factory, factory))
+                for name, factory in expression_types.items())
+        if self.profile:
+            expression_types = profile.instrument(
+                expression_types, self.profiled_expressions)
+        return ExpressionParser(expression_types, self.default_expression)
+
+    def digest(self, body, names):
+        sha = pkg_digest.copy()
+        sha.update(body.encode('utf-8', 'ignore'))
+        sha.update((self.filename or '').encode('utf-8'))
+        sha.update(';'.join(names).encode('utf-8'))
+        cls = type(self)
+        if cls.__module__ != __name__:
+            sha.update((";class=%s" % digest_name(cls)).encode('utf-8'))
+        for name in self.digest_attributes:
+            value = digest_value(getattr(self, name, None))
+            sha.update((";%s=%s" % (name, value)).encode('utf-8'))
+        return sha.hexdigest()
+
+    def cook(self, body):
+        self.__dict__.pop('_v_builtins', None)
+        self.__dict__.pop('_v_variants', None)
+        super(BaseTemplate, self).cook(body)
+        if self.cached_macros:
+            fragment.cache_macros(self, body)
+        if self.languages:
+            self._v_body = body
+
+    def _compile(self, body, builtins):
+        program = self.parse(body)
+        module = Module("initialize", program)
+        if self.variant_language is None:
+            compiler = NameResolvingCompiler(
+                self.engine, module, self.filename, body, builtins,
+                strict=self.strict, resolve_names=self.resolve_names)
+        else:
+            compiler = variants.TranslatingCompiler(
+                self.variant_language, self.engine, module, self.filename,
+                body, builtins, strict=self.strict,
+                resolve_names=self.resolve_names)
+        return compiler.code
+
+    def bind(self, ob, request=None):
+        return BoundPageTemplate.bind(self, ob, request)
 
     def render(self, target_language=None, **context):
         # We always include a ``request`` variable; it is (currently)
         # depended on in various expression types and must be defined
         request = context.setdefault('request', None)
 
+        # The negotiated language and translation function are shared
+        # by all templates rendered for the request
+        translator = get_translator(
+            request, self.memoize_translations and MemoizingTranslator or
+            Translator)
+
         if target_language is None:
-            try:
-                target_language = i18n.negotiate(request)
-            except:
-                target_language = None
+            target_language = translator.language
 
         context['target_language'] = target_language
-
-        # bind translation-method to request
-        def translate(
-            msgid, domain=None, mapping=None,
-            target_language=None, default=None,
-            context=None):
-            if msgid is MV:
-                # Special case handling of Zope2's Missing.MV
-                # (Missing.Value) used by the ZCatalog but is
-                # unhashable
-                return
-            return fast_translate(
-                msgid, domain, mapping, request, target_language, default)
-        context["translate"] = translate
+        context["translate"] = translator
 
         if request is not None and not isinstance(request, six.string_types):
             content_type = self.content_type or 'text/html'
@@ -159,12 +375,56 @@ class BaseTemplate(template.PageTemplate):
                 response.setHeader(
                     "Content-Type", content_type)
 
-        base_renderer = super(BaseTemplate, self).render
-        return base_renderer(**context)
+        # The static messages are translated already in the variant
+        # of the template for the target language (if any)
+        languages = self.languages
+        if languages and target_language in languages:
+            variant = variants.get_variant(self, target_language)
+            base_renderer = super(BaseTemplate, variant).render
+        else:
+            base_renderer = super(BaseTemplate, self).render
+
+        # The providers are rendered by the caller if it has set up a
+        # batch for this template (see ``render_async``)
+        batch = expressions.pop_provider_batch()
+        if batch is not None:
+            context['__provider_batch'] = batch
+            return base_renderer(**context)
+
+        if not self.batch_providers:
+            return base_renderer(**context)
+
+        batch = context['__provider_batch'] = expressions.ProviderBatch()
+        return batch(base_renderer(**context))
+
+    def render_iter(self, chunk_size=None, **context):
+        """Render the template, yielding the output in chunks as it is
+        produced (see ``z3c.pt.stream``)."""
+
+        return render_chunks(
+            lambda: self.render(**context),
+            chunk_size or self.chunk_size, self.batch_providers)
+
+    def render_async(self, **context):
+        """Return a coroutine which renders the template; content
+        providers may have coroutine ``update`` and ``render`` methods
+        which are awaited concurrently (see ``z3c.pt.aio``; requires
+        Python 3.5 or newer)."""
+
+        from z3c.pt.aio import render_async
+        return render_async(lambda: self.render(**context))
+
+    def output_stream_factory(self):
+        stream = pop_stream()
+        if stream is None:
+            stream = default_stream_factory()
+        return stream
 
     def __call__(self, *args, **kwargs):
-        bound_pt = self.bind(self)
-        return bound_pt(*args, **kwargs)
+        kwargs.setdefault('args', args)
+        request = kwargs.pop('request', None)
+        context = self._pt_get_context(self, request, kwargs)
+        return self.render(**context)
 
     def _pt_get_context(self, instance, request, kwargs):
         return dict(
@@ -178,43 +438,94 @@ class BaseTemplate(template.PageTemplate):
 
 class BaseTemplateFile(BaseTemplate, template.PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
-    class where the instance is used to get an absolute path."""
+    class where the instance is used to get an absolute path; pass
+    ``package`` (a module or its name, e.g. ``__name__``) to give it
+    explicitly.
 
-    cache = {}
+    The template file is not read (nor checked for existence) until
+    the template is first used."""
 
-    def __init__(self, filename, path=None, content_type=None, **kwargs):
+    loader_class = template.TemplateLoader
+
+    # If set, the template is read again when the file changes, which
+    # is detected in the background (unlike ``auto_reload``).
+    watch = WATCH
+
+    def __init__(self, filename, path=None, content_type=None,
+                 package=None, search_path=None, loader_class=None,
+                 **kwargs):
         if path is not None:
             filename = os.path.join(path, filename)
 
         if not os.path.isabs(filename):
-            for depth in (1, 2):
-                frame = sys._getframe(depth)
-                package_name = frame.f_globals.get('__name__', None)
-                if package_name is not None and \
-                       package_name != self.__module__:
-                    module = sys.modules[package_name]
-                    try:
-                        path = module.__path__[0]
-                    except AttributeError:
-                        path = module.__file__
-                        path = path[:path.rfind(os.sep)]
-                    break
-                else:
-                    package_path = frame.f_globals.get('__file__', None)
-                    if package_path is not None:
-                        path = os.path.dirname(package_path)
+            if package is None:
+                for depth in (1, 2):
+                    f_globals = sys._getframe(depth).f_globals
+                    package_name = f_globals.get('__name__', None)
+                    if package_name is not None and \
+                           package_name != self.__module__:
+                        path = package_path(package_name)
                         break
+                    else:
+                        path = f_globals.get('__file__', None)
+                        if path is not None:
+                            path = os.path.dirname(path)
+                            break
+            else:
+                path = package_path(getattr(package, '__name__', package))
 
             if path is not None:
                 filename = os.path.join(path, filename)
 
-        template.PageTemplateFile.__init__(
-            self, filename, **kwargs)
+        # The relative template loader is set up on first use (see
+        # ``_loader``).
+        self._loader_args = search_path, loader_class, kwargs
+        super(template.PageTemplateFile, self).__init__(filename, **kwargs)
 
         # Set content-type last, so that we can override whatever was
         # magically sniffed from the source template.
         self.content_type = content_type
 
+    def _get_loader(self):
+        loader = self.__dict__.get('_v_loader')
+        if loader is None:
+            search_path, loader_class, config = self._loader_args
+            if search_path is None:
+                search_path = []
+            elif isinstance(search_path, six.string_types):
+                search_path = [search_path]
+            else:
+                search_path = list(search_path)
+
+            if self.prepend_relative_search_path:
+                search_path.insert(0, os.path.dirname(self.filename))
+
+            loader_class = loader_class or self.loader_class
+            loader = loader_class(search_path=search_path, **config)
+            loader = self.__dict__['_v_loader'] = loader.bind(type(self))
+        return loader
+
+    def _set_loader(self, loader):
+        self.__dict__['_v_loader'] = loader
+
+    _loader = property(_get_loader, _set_loader)
+
+    def cook_check(self):
+        # The template is cooked by one thread at a time; threads which
+        # need the template while it is cooked wait for the result
+        # instead of cooking it as well. The lock is created on first
+        # use (``setdefault`` is atomic).
+        if self._cooked is False or self.auto_reload and \
+               self.mtime() != self._v_last_read:
+            lock = self.__dict__.setdefault('_v_cook_lock', threading.Lock())
+            with lock:
+                super(BaseTemplateFile, self).cook_check()
+
+    def cook(self, body):
+        super(BaseTemplateFile, self).cook(body)
+        if self.watch:
+            get_watcher().watch(self)
+
 
 class PageTemplate(BaseTemplate):
     """Page Templates using TAL, TALES, and METAL.
@@ -240,8 +551,6 @@ class PageTemplateFile(BaseTemplateFile, PageTemplate):
 
     Initialize with a filename."""
 
-    cache = {}
-
 
 class ViewPageTemplate(PageTemplate):
     """Template class suitable for use with a Zope browser view; the
@@ -265,27 +574,42 @@ class ViewPageTemplate(PageTemplate):
             )
 
     def __call__(self, _ob=None, context=None, request=None, **kwargs):
-        kwargs.setdefault('context', context)
-        kwargs.setdefault('request', request)
-        bound_pt = self.bind(_ob)
-        return bound_pt(**kwargs)
+        kwargs['context'] = context
+        kwargs.setdefault('args', ())
+        context = self._pt_get_context(_ob, request, kwargs)
+        return self.render(**context)
 
 
 class ViewPageTemplateFile(ViewPageTemplate, PageTemplateFile):
     """If ``filename`` is a relative path, the module path of the
     class where the instance is used to get an absolute path."""
 
-    cache = {}
-
 
 class BoundPageTemplate(object):
     """When a page template class is used as a property, it's bound to
     the class instance on access, which is implemented using this
-    helper class."""
+    helper class.
+
+    The template is bound to an object using ``bind``; the constructor
+    takes a render function (``render(**kwargs)``) instead, as in
+    earlier versions."""
+
+    __slots__ = 'im_self', '_ob', '_request', '_render'
 
     def __init__(self, pt, render):
-        object.__setattr__(self, 'im_self', pt)
-        object.__setattr__(self, 'im_func', render)
+        _set_im_self(self, pt)
+        _set_ob(self, None)
+        _set_request(self, None)
+        _set_render(self, render)
+
+    @classmethod
+    def bind(cls, pt, ob, request=None):
+        bound = cls.__new__(cls)
+        _set_im_self(bound, pt)
+        _set_ob(bound, ob)
+        _set_request(bound, request)
+        _set_render(bound, None)
+        return bound
 
     macros = property(lambda self: self.im_self.macros)
     filename = property(lambda self: self.im_self.filename)
@@ -294,6 +618,31 @@ class BoundPageTemplate(object):
         kw.setdefault('args', args)
         return self.im_func(**kw)
 
+    def im_func(self, request=_marker, **kwargs):
+        render = self._render
+        if render is not None:
+            if request is not _marker:
+                kwargs['request'] = request
+            return render(**kwargs)
+
+        if request is _marker:
+            request = self._request
+        pt = self.im_self
+        context = pt._pt_get_context(self._ob, request, kwargs)
+        return pt.render(**context)
+
+    def render_iter(self, chunk_size=None, **kw):
+        kw.setdefault('args', ())
+        pt = self.im_self
+        return render_chunks(
+            lambda: self.im_func(**kw),
+            chunk_size or pt.chunk_size, pt.batch_providers)
+
+    def render_async(self, **kw):
+        from z3c.pt.aio import render_async
+        kw.setdefault('args', ())
+        return render_async(lambda: self.im_func(**kw))
+
     def __setattr__(self, name, v):
         raise AttributeError("Can't set attribute", name)
 
@@ -301,3 +650,9 @@ class BoundPageTemplate(object):
         return "<%s.Bound%s %r>" % (
             type(self.im_self).__module__,
             type(self.im_self).__name__, self.filename)
+
+# Attributes can only be set using the slot descriptors
+_set_im_self = BoundPageTemplate.im_self.__set__
+_set_ob = BoundPageTemplate._ob.__set__
+_set_request = BoundPageTemplate._request.__set__
+_set_render = BoundPageTemplate._render.__set__
@@ -0,0 +1,188 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compile page templates ahead of time.
+
+Usage: z3c.pt-precompile [options] [package or directory ...]
+
+The compiled templates are written to a subdirectory of the cache
+directory for the installed versions of z3c.pt, Chameleon and Python.
+Set ``Z3C_PT_CACHE_DIRECTORY`` to the same directory in the
+application environment to load them instead of compiling on first
+render.
+
+A compiled template is found using a digest of the template filename,
+its source, the configuration of the template class which affects
+compilation (``BaseTemplate.digest_attributes``) and the versions of
+the installed packages; the class itself is only included if it's not
+one of the classes of ``z3c.pt.pagetemplate``. The command must run
+in the same environment (and with the same installation paths) as
+the application; a template which has changed since is simply
+compiled again when first rendered.
+"""
+import os
+import sys
+import json
+import logging
+import optparse
+import pkgutil
+
+from z3c.pt import pagetemplate
+from z3c.pt.cache import persistent_loader
+from z3c.pt.pagetemplate import PageTemplateFile
+
+log = logging.getLogger('z3c.pt')
+
+# The classes of z3c.pt with the same configuration share compiled
+# templates; list a class here if it's defined elsewhere or its
+# configuration differs.
+template_classes = PageTemplateFile,
+
+MANIFEST = 'manifest.json'
+
+
+def package_path(name):
+    __import__(name)
+    return pagetemplate.package_path(name)
+
+
+def installed_packages():
+    """Yield the paths of the top-level packages on ``sys.path``."""
+
+    for importer, name, ispkg in pkgutil.iter_modules():
+        if ispkg and hasattr(importer, 'path'):
+            yield os.path.join(importer.path, name)
+
+
+def find_templates(paths, extension=".pt"):
+    for path in paths:
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(extension):
+                    yield os.path.join(dirpath, filename)
+
+
+def read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def write_manifest(path, manifest):
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(temp, path)
+
+
+def compile_templates(filenames, loader, manifest=None,
+                      classes=template_classes):
+    """Compile each template file using ``loader``.
+
+    The ``manifest`` maps filenames to the modification time at the
+    time they were last compiled; unchanged files are skipped. Returns
+    the lists of compiled, skipped and failed filenames.
+    """
+
+    if manifest is None:
+        manifest = {}
+
+    compiled, skipped, failed = [], [], []
+    for filename in filenames:
+        filename = os.path.abspath(filename)
+        mtime = os.path.getmtime(filename)
+        if manifest.get(filename) == mtime:
+            skipped.append(filename)
+            continue
+
+        try:
+            for cls in classes:
+                template = cls(filename)
+                template.loader = loader
+                template.cook_check()
+        except Exception:
+            log.debug("unable to compile %s." % filename, exc_info=True)
+            failed.append(filename)
+            manifest.pop(filename, None)
+        else:
+            compiled.append(filename)
+            manifest[filename] = mtime
+
+    return compiled, skipped, failed
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage="%prog [options] [package or directory ...]")
+    parser.add_option(
+        "-d", "--cache-directory", dest="directory",
+        default=os.environ.get('Z3C_PT_CACHE_DIRECTORY'),
+        help="cache directory (defaults to $Z3C_PT_CACHE_DIRECTORY)")
+    parser.add_option(
+        "-a", "--all", dest="all", action="store_true", default=False,
+        help="compile the templates of all installed packages")
+    parser.add_option(
+        "-f", "--force", dest="force", action="store_true", default=False,
+        help="compile templates which have not changed")
+    parser.add_option(
+        "-v", "--verbose", dest="verbose", action="store_true",
+        default=False, help="list the templates which failed to compile")
+
+    options, args = parser.parse_args(argv)
+
+    if not options.directory:
+        parser.error("no cache directory given.")
+
+    if not args and not options.all:
+        parser.error("no packages or directories given.")
+
+    paths = []
+    for arg in args:
+        if os.path.isdir(arg):
+            paths.append(arg)
+        else:
+            try:
+                paths.append(package_path(arg))
+            except ImportError:
+                parser.error("no such package or directory: %s." % arg)
+
+    if options.all:
+        paths.extend(installed_packages())
+
+    loader = persistent_loader(options.directory)
+    manifest_path = os.path.join(loader.path, MANIFEST)
+    manifest = {}
+    if not options.force:
+        manifest = read_manifest(manifest_path)
+
+    compiled, skipped, failed = compile_templates(
+        find_templates(paths), loader, manifest)
+
+    write_manifest(manifest_path, manifest)
+
+    if options.verbose:
+        for filename in failed:
+            sys.stderr.write("failed: %s\n" % filename)
+
+    sys.stdout.write(
+        "%d compiled, %d unchanged, %d failed (%s).\n" % (
+            len(compiled), len(skipped), len(failed), loader.path))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
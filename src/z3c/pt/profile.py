@@ -0,0 +1,155 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Profile the expressions of templates.
+
+Templates with the ``profile`` option set (or all templates if the
+``Z3C_PT_PROFILE`` environment variable is set) are compiled with
+instrumented path-, provider- and Python-expressions, which record
+their number of calls and cumulative time (including that of nested
+expressions) by template filename, line and expression source.
+Templates without the option are compiled as usual and have no
+overhead.
+
+  >>> from z3c.pt.pagetemplate import PageTemplate
+  >>> template = PageTemplate('''\\
+  ... <div tal:repeat="i python: range(3)">
+  ...   <span tal:replace="options/title" />
+  ... </div>''', profile=True)
+
+  >>> reset()
+  >>> print(template(title=u"Hello").strip().replace("\\n", ""))
+  <div>  Hello</div><div>  Hello</div><div>  Hello</div>
+
+  >>> for entry in sorted(stats(), key=lambda entry: entry[:3]):
+  ...     print(entry[:5])
+  ('<string>', 1, 'python', 'range(3)', 1)
+  ('<string>', 2, 'path', 'options/title', 3)
+
+  >>> dump() # doctest: +SKIP
+  calls    total ms  per call us  expression
+      3       0.012        4.105  <string>:2 path:options/title
+      1       0.004        4.053  <string>:1 python:range(3)
+
+  >>> reset()
+  >>> stats()
+  []
+"""
+import ast
+import sys
+import time
+import itertools
+import threading
+
+from chameleon.astutil import Symbol
+from chameleon.codegen import template
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+_stats = {}
+_lock = threading.Lock()
+_counter = itertools.count()
+
+
+def record(key, start):
+    elapsed = timer() - start
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+def stats():
+    """Return a list of ``(filename, line, type, source, calls,
+    seconds)`` tuples, most expensive first."""
+
+    with _lock:
+        entries = [key + tuple(entry) for key, entry in _stats.items()]
+
+    entries.sort(key=lambda entry: entry[5], reverse=True)
+    return entries
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def dump(stream=None, limit=None):
+    """Write the profile (the ``limit`` most expensive expressions)
+    to ``stream`` (standard output by default)."""
+
+    if stream is None:
+        stream = sys.stdout
+
+    stream.write("%6s %11s %12s  %s\n" % (
+        "calls", "total ms", "per call us", "expression"))
+    for filename, line, kind, source, calls, seconds in stats()[:limit]:
+        stream.write("%6d %11.3f %12.3f  %s:%d %s:%s\n" % (
+            calls, seconds * 1000, seconds * 1e6 / calls,
+            filename, line, kind, source))
+
+
+class ProfiledExpr(object):
+    """Wraps the assignment of an expression compiler in a call to
+    ``record``."""
+
+    def __init__(self, factory, kind, expression):
+        self.compiler = factory(expression)
+        filename = getattr(expression, 'filename', None) or "<string>"
+        line = getattr(expression, 'location', (0, 0))[0]
+        source = " ".join(expression.split())
+        self.key = filename, line, kind, source
+
+    def __call__(self, target, engine):
+        assignment = self.compiler(target, engine)
+        start = "__profile_%d" % next(_counter)
+
+        finalbody = template(
+            "record(key, start)",
+            record=Symbol(record),
+            key=ast.Tuple([ast.Str(self.key[0]), ast.Num(self.key[1]),
+                           ast.Str(self.key[2]), ast.Str(self.key[3])],
+                          ast.Load()),
+            start=start,
+            )
+
+        if hasattr(ast, 'Try'):
+            wrapped = ast.Try(assignment, [], [], finalbody)
+        else:
+            wrapped = ast.TryFinally(assignment, finalbody)
+
+        return template(
+            "start = timer()", start=start, timer=Symbol(timer)
+            ) + [wrapped]
+
+
+def instrument(expression_types, profiled):
+    """Return a copy of ``expression_types`` in which the expression
+    types which are subclasses of ``profiled`` are instrumented."""
+
+    def factory(kind, cls):
+        wrapper = lambda expression: ProfiledExpr(cls, kind, expression)
+        wrapper.expression_type = cls
+        return wrapper
+
+    return dict(
+        (kind, factory(kind, cls)
+         if isinstance(cls, type) and issubclass(cls, profiled) else cls)
+        for kind, cls in expression_types.items()
+        )
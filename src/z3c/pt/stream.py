@@ -0,0 +1,134 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Chunked rendering.
+
+The template is rendered in a greenlet (if the ``greenlet`` package
+is available) which switches back to the consumer each time a chunk
+of output is ready; since it runs in the same thread, thread-local
+state such as the current site and security interaction is
+preserved. Without greenlets, the output is rendered in full and then
+split into chunks.
+"""
+import threading
+
+from chameleon.utils import join
+
+try:
+    from greenlet import greenlet
+    from greenlet import getcurrent
+except ImportError:
+    greenlet = None
+
+_local = threading.local()
+
+
+def pop_stream():
+    """Return (and forget) the output stream set up for the next
+    template to render, if any."""
+
+    stream = getattr(_local, 'stream', None)
+    if stream is not None:
+        _local.stream = None
+    return stream
+
+
+class ChunkedStream(list):
+    """Output stream which passes on its content to ``emit`` in chunks
+    of at least ``size`` characters.
+
+    The stream appears to hold all output written to it, such that
+    ``tal:on-error`` can drop the output written since it began, as
+    long as that has not yet been passed on.
+
+      >>> chunks = []
+      >>> stream = ChunkedStream(4, chunks.append)
+      >>> for s in ('ab', 'cd', 'ef'):
+      ...     stream.append(s)
+      >>> chunks, len(stream)
+      (['abcd'], 3)
+      >>> del stream[2:]
+      >>> del stream[1:]
+      Traceback (most recent call last):
+      ...
+      RuntimeError: Output has already been sent.
+    """
+
+    def __init__(self, size, emit):
+        self.emit = emit
+        self.offset = 0
+
+        # The number of characters not yet passed on is kept in a cell
+        # of the ``append`` closure (which is faster than a method).
+        self.pending = pending = [0]
+        items = list.append
+
+        def append(s):
+            items(self, s)
+            pending[0] += len(s)
+            if pending[0] >= size:
+                self.flush()
+
+        self.append = append
+
+    def flush(self):
+        chunk = join(self)
+        self.offset += list.__len__(self)
+        self.pending[0] = 0
+        list.__delitem__(self, slice(None))
+        self.emit(chunk)
+
+    def __len__(self):
+        return self.offset + list.__len__(self)
+
+    def __delitem__(self, index):
+        start = index.start - self.offset
+        if start < 0:
+            raise RuntimeError("Output has already been sent.")
+        list.__delitem__(self, slice(start, None))
+        self.pending[0] = sum(map(len, self))
+
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, None))
+
+
+def render_chunks(render, chunk_size, buffered=False):
+    """Call ``render`` and yield its output in chunks; the output stream
+    is used by the first template rendered by the call."""
+
+    if greenlet is None or buffered:
+        output = render()
+        for i in range(0, len(output), chunk_size):
+            yield output[i:i + chunk_size]
+        return
+
+    def emit(chunk):
+        child.parent.switch(chunk)
+
+    def run():
+        _local.stream = ChunkedStream(chunk_size, emit)
+        try:
+            return render()
+        finally:
+            _local.stream = None
+
+    child = greenlet(run)
+    try:
+        while not child.dead:
+            child.parent = getcurrent()
+            chunk = child.switch()
+            if chunk:
+                yield chunk
+    finally:
+        if not child.dead:
+            child.throw()
@@ -29,7 +29,11 @@ def setUp(suite):
 
 def test_suite():
     filesuites = 'README.txt',
-    testsuites = 'z3c.pt.expressions', 'z3c.pt.namespaces'
+    testsuites = (
+        'z3c.pt.expressions', 'z3c.pt.namespaces', 'z3c.pt.cache',
+        'z3c.pt.stream', 'z3c.pt.translation', 'z3c.pt.profile',
+        'z3c.pt.fragment', 'z3c.pt.memo', 'z3c.pt.variants', 'z3c.pt.names',
+        'z3c.pt.benchmark.runner')
 
     return unittest.TestSuite(
         [doctest.DocFileSuite(
@@ -13,6 +13,11 @@
 ##############################################################################
 import unittest
 
+from chameleon.loader import MemoryLoader
+
+from z3c.pt.cache import TemplateCache
+from z3c.pt.pagetemplate import PageTemplateFile
+
 class LoadTests:
     def _makeOne(self, search_path=None, **kwargs):
         klass = self._getTargetClass()
@@ -57,6 +62,103 @@ class LoadPageTests(unittest.TestCase, LoadTests):
     def _load(self, loader, filename):
         return loader.load_page(filename)
 
+
+class ThreadedLoadTests(unittest.TestCase):
+    def test_load(self):
+        import os
+        import time
+        import threading
+        from z3c.pt.loader import TemplateLoader
+        created = []
+
+        class Template(PageTemplateFile):
+            def __init__(self, *args, **kwargs):
+                created.append(args)
+                # Give the other threads a chance to try as well
+                time.sleep(0.05)
+                super(Template, self).__init__(*args, **kwargs)
+
+        here = os.path.dirname(__file__)
+        loader = TemplateLoader(search_path=[here])
+        start = threading.Event()
+        results = []
+
+        def load():
+            start.wait()
+            template = loader.load('helloworld.pt', Template)
+            results.append((template, template()))
+
+        threads = [threading.Thread(target=load) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(created), 1)
+
+
+class CachedTemplateFile(PageTemplateFile):
+    loader = TemplateCache(loader=MemoryLoader())
+
+
+class WarmUpTests(unittest.TestCase):
+    def setUp(self):
+        CachedTemplateFile.loader.clear()
+
+    def _makeOne(self, search_path=None, **kwargs):
+        from z3c.pt.loader import TemplateLoader
+        return TemplateLoader(search_path, **kwargs)
+
+    def test_find(self):
+        import os
+        here = os.path.dirname(__file__)
+        loader = self._makeOne(search_path=[here])
+        view = os.path.join(here, 'view.pt')
+        self.assertEqual(list(loader.find(['view.pt'])), [view])
+        self.assertEqual(list(loader.find([view])), [view])
+        self.assertTrue(view in loader.find(['z3c.pt.tests:v*.pt']))
+        self.assertTrue(view in loader.find(['z3c.pt:tests']))
+
+    def _warm_up(self, processes):
+        import os
+        here = os.path.dirname(__file__)
+        loader = self._makeOne(search_path=[here])
+        compiled, failed = loader.warm_up(
+            ['view.pt', 'helloworld.pt'], processes=processes,
+            cls=CachedTemplateFile)
+        self.assertEqual(len(compiled), 2)
+        self.assertEqual(failed, [])
+
+        cache = CachedTemplateFile.loader
+        self.assertEqual(cache.stats()['entries'], 2)
+        misses = cache.stats()['misses']
+        CachedTemplateFile(os.path.join(here, 'view.pt')).cook_check()
+        self.assertEqual(cache.stats()['misses'], misses)
+
+    def test_warm_up(self):
+        self._warm_up(1)
+
+    def test_warm_up_processes(self):
+        self._warm_up(2)
+
+    def test_warm_up_failed(self):
+        import os
+        import shutil
+        import tempfile
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open(os.path.join(path, 'broken.pt'), 'w') as f:
+            f.write('<div tal:content="x" tal:replace="y" />')
+        loader = self._makeOne(search_path=[path])
+        compiled, failed = loader.warm_up(['*.pt'], processes=1,
+                                          cls=CachedTemplateFile)
+        self.assertEqual(
+            (compiled, failed), ([], [os.path.join(path, 'broken.pt')]))
+
+
 def test_suite():
     import sys
     return unittest.findTestCases(sys.modules[__name__])
@@ -0,0 +1,85 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import os
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(__file__)
+
+
+class TestPrecompile(unittest.TestCase):
+    def setUp(self):
+        from z3c.pt.cache import persistent_loader
+        self.directory = tempfile.mkdtemp()
+        self.loader = persistent_loader(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _compile(self, filenames, manifest=None):
+        from z3c.pt.precompile import compile_templates
+        return compile_templates(filenames, self.loader, manifest)
+
+    def test_versioned_path(self):
+        from z3c.pt.cache import versioned_path
+        path = versioned_path(self.directory)
+        self.assertEqual(os.path.dirname(path), self.directory)
+        self.assertTrue("chameleon" in os.path.basename(path))
+        self.assertEqual(self.loader.path, path)
+
+    def test_find_templates(self):
+        from z3c.pt.precompile import find_templates
+        filenames = list(find_templates([here]))
+        self.assertTrue(os.path.join(here, 'view.pt') in filenames)
+        self.assertFalse(os.path.join(here, 'view.css') in filenames)
+
+    def test_load_compiled(self):
+        from chameleon.loader import ModuleLoader
+        from z3c.pt.pagetemplate import ViewPageTemplateFile
+        filename = os.path.join(here, 'view.pt')
+        compiled, skipped, failed = self._compile([filename])
+        self.assertEqual(compiled, [filename])
+
+        def compile(body, builtins):
+            raise AssertionError("template was compiled again")
+
+        template = ViewPageTemplateFile(filename)
+        template.loader = ModuleLoader(self.loader.path)
+        template._compile = compile
+        template.cook_check()
+        self.assertTrue(template._cooked)
+
+    def test_manifest(self):
+        filename = os.path.join(here, 'view.pt')
+        manifest = {}
+        self._compile([filename], manifest)
+        self.assertEqual(manifest, {filename: os.path.getmtime(filename)})
+        compiled, skipped, failed = self._compile([filename], manifest)
+        self.assertEqual((compiled, skipped), ([], [filename]))
+
+    def test_failure(self):
+        filename = os.path.join(self.directory, 'broken.pt')
+        with open(filename, 'w') as f:
+            f.write('<div xmlns:tal="http://xml.zope.org/namespaces/tal" '
+                    'tal:content="a" tal:replace="b" />')
+        manifest = {}
+        compiled, skipped, failed = self._compile([filename], manifest)
+        self.assertEqual(failed, [filename])
+        self.assertEqual(manifest, {})
+
+
+def test_suite():
+    import sys
+    return unittest.findTestCases(sys.modules[__name__])
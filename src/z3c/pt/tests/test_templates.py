@@ -16,6 +16,16 @@ import unittest
 import zope.component.testing
 import zope.configuration.xmlconfig
 
+# The path items passed to ``record_traverse``
+traversed = []
+
+
+def record_traverse(base, econtext, call, path_items):
+    """A custom path traverser (which joins the path)."""
+
+    traversed.append(path_items)
+    return u"/".join(path_items)
+
 
 class TestPageTemplateFile(unittest.TestCase):
     def setUp(self):
@@ -69,6 +79,27 @@ class TestPageTemplateFile(unittest.TestCase):
         self.assertTrue("supported" in result)
         self.assertTrue("some path" in result)
 
+    def test_package(self):
+        import os
+        import z3c.pt.tests
+        from z3c.pt.pagetemplate import PageTemplateFile
+        here = os.path.dirname(z3c.pt.tests.__file__)
+        for package in ('z3c.pt.tests', z3c.pt.tests):
+            template = PageTemplateFile("view.pt", package=package)
+            self.assertEqual(template.filename, os.path.join(here, "view.pt"))
+
+    def test_lazy(self):
+        import os
+        from z3c.pt.pagetemplate import PageTemplateFile
+        template = PageTemplateFile("missing.pt")
+        self.assertFalse(template._cooked)
+        self.assertFalse('_v_loader' in template.__dict__)
+        loader = template._loader
+        self.assertTrue(loader is template._loader)
+        self.assertEqual(
+            loader.func.__self__.search_path,
+            [os.path.dirname(template.filename)])
+
     def test_provider(self):
         from z3c.pt.pagetemplate import ViewPageTemplateFile
 
@@ -131,6 +162,1775 @@ class TestPageTemplateFile(unittest.TestCase):
         self.assertTrue(repr({'context': context}) in result)
 
 
+class TestBuiltins(unittest.TestCase):
+    def _makeOne(self, body=u"<div>${nothing}</div>"):
+        from z3c.pt.pagetemplate import PageTemplate
+        return PageTemplate(body)
+
+    def test_memoized(self):
+        template = self._makeOne()
+        builtins = template.builtins
+        self.assertTrue(builtins is template.builtins)
+        self.assertTrue(builtins['nothing'] is None)
+        self.assertTrue('modules' in builtins)
+        self.assertTrue('tales' in builtins)
+
+    def test_shared_by_engine_configuration(self):
+        self.assertTrue(
+            self._makeOne().builtins['tales'] is
+            self._makeOne().builtins['tales'])
+
+    def test_engine_configuration_change(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = self._makeOne()
+        builtins = template.builtins
+        template.expression_types = dict(
+            PageTemplate.expression_types, foo=None)
+        self.assertFalse(builtins is template.builtins)
+
+    def test_cook_drops_memo(self):
+        template = self._makeOne()
+        stale = (template.expression_types, template.default_expression, {})
+        template.__dict__['_v_builtins'] = stale
+        self.assertTrue(template.builtins is stale[2])
+        template.cook(u"<div>${python: path('nothing')}</div>")
+        self.assertFalse(template.builtins is stale[2])
+        self.assertEqual(template(), u"<div></div>")
+
+class TestPathTraverse(unittest.TestCase):
+    def setUp(self):
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def _traverse(self, base, path_items, call=False, **econtext):
+        from z3c.pt.expressions import path_traverse
+        return path_traverse(base, econtext, call, path_items)
+
+    def test_plan(self):
+        class Context(object):
+            title = u"Title"
+        base = {'a': {'b': Context()}}
+        self.assertEqual(self._traverse(base, ('a', 'b', 'title')), u"Title")
+        self.assertEqual(self._traverse(base, ()), base)
+
+    def test_namespaces(self):
+        from z3c.pt.namespaces import function_namespaces
+
+        class Upper(object):
+            def __init__(self, context):
+                self.context = context
+
+            def upper(self):
+                return self.context.upper()
+
+        function_namespaces.registerFunctionNamespace('test', Upper)
+        base = {'title': u"title"}
+        self.assertEqual(
+            self._traverse(base, ('title', ('test', 'upper'))), u"TITLE")
+        self.assertEqual(
+            self._traverse(base, ('title', (None, 'test:upper'))), u"TITLE")
+
+    def test_default(self):
+        from z3c.pt.expressions import path_traverse
+        marker = object()
+        base = {'a': {'b': 1}}
+        self.assertTrue(path_traverse(
+            base, {}, False, ('a', 'x', 'y'), None, marker) is marker)
+        self.assertEqual(
+            path_traverse(base, {}, False, ('a', 'b'), None, marker), 1)
+
+    def test_traverser_consumes_path(self):
+        from zope.component import provideAdapter
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+
+        class Folder(object):
+            pass
+
+        @implementer(ITraversable)
+        class Traverser(object):
+            def __init__(self, context, request=None):
+                self.context = context
+
+            def traverse(self, name, further_path):
+                return {'path': [name, further_path.pop()], 'x': name}
+
+        provideAdapter(Traverser, (Folder, ), ITraversable)
+        self.assertEqual(
+            self._traverse(Folder(), ('a', 'b', 'path')), ['a', 'b'])
+        self.assertEqual(
+            self._traverse(Folder(), ('a', 'b', 'x')), 'a')
+
+    def test_custom_traverser(self):
+        from chameleon.astutil import Symbol
+        from z3c.pt.expressions import PathExpr
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class Template(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types,
+                path=type('PathExpr', (PathExpr, ), {
+                    'traverser': Symbol(record_traverse)}))
+
+        del traversed[:]
+        template = Template(
+            u"<div tal:define=\"name string:a\">"
+            u"${options/x:title/?name}</div>")
+        self.assertEqual(template(), u"<div>x:title/a</div>")
+        self.assertEqual(traversed, [('x:title', 'a')])
+
+
+class TestInlineCache(unittest.TestCase):
+    def setUp(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+        zope.component.testing.setUp(self)
+        provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def test_strategies(self):
+        from z3c.pt.expressions import path_traverse
+        from z3c.pt.expressions import _adapter_only
+
+        class Context(object):
+            title = u"Title"
+
+        class Container(object):
+            def __getitem__(self, name):
+                return {'item': Context()}[name]
+
+        cache = [{}, {}, {}]
+        base = {'a': Container()}
+        for i in range(2):
+            self.assertEqual(path_traverse(
+                base, {}, False, ('a', 'item', 'title'), cache), u"Title")
+
+        self.assertEqual(cache, [
+            {dict: dict.get},
+            {Container: _adapter_only},
+            {Context: getattr},
+            ])
+
+    def test_custom_adapter(self):
+        from zope.component import provideAdapter
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.expressions import path_traverse
+
+        class Context(object):
+            pass
+
+        @implementer(ITraversable)
+        class Traverser(object):
+            def __init__(self, context, request=None):
+                self.context = context
+
+            def traverse(self, name, further_path):
+                return u"adapted-" + name
+
+        provideAdapter(Traverser, (Context, ), ITraversable)
+
+        cache = [{}]
+        context = Context()
+        self.assertEqual(path_traverse(
+            context, {}, False, ('title', ), cache), u"adapted-title")
+        context.title = u"instance-attr"
+        self.assertEqual(path_traverse(
+            context, {}, False, ('title', ), cache), u"instance-attr")
+
+    def test_directly_provided(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import directlyProvides
+        from zope.interface import implementer
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.expressions import path_traverse
+
+        class IFoo(Interface):
+            pass
+
+        class Context(object):
+            pass
+
+        @implementer(ITraversable)
+        class Traverser(object):
+            def __init__(self, context, request=None):
+                self.context = context
+
+            def traverse(self, name, further_path):
+                return u"from-adapter"
+
+        provideAdapter(Traverser, (IFoo, ), ITraversable)
+
+        cache = [{}]
+        a = Context()
+        self.assertRaises(
+            LookupError, path_traverse, a, {}, False, ('x', ), cache)
+        c = Context()
+        c.x = u"attr-c"
+        directlyProvides(c, IFoo)
+        self.assertEqual(
+            path_traverse(c, {}, False, ('x', ), cache), u"attr-c")
+        del c.x
+        self.assertEqual(
+            path_traverse(c, {}, False, ('x', ), cache), u"from-adapter")
+
+    def test_megamorphic(self):
+        from z3c.pt.expressions import path_traverse
+        from z3c.pt.expressions import INLINE_CACHE_SIZE
+
+        cache = [{}]
+        for i in range(INLINE_CACHE_SIZE * 2):
+            cls = type('Context%d' % i, (object, ), {'title': i})
+            self.assertEqual(
+                path_traverse(cls(), {}, False, ('title', ), cache), i)
+        self.assertEqual(len(cache[0]), INLINE_CACHE_SIZE)
+
+    def test_switch(self):
+        from z3c.pt.expressions import PathExpr
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class Template(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types,
+                path=type('PathExpr', (PathExpr, ), {'inline_cache': False}))
+
+        body = u"<div>${options/a/b}</div>"
+        for factory, cached in ((PageTemplate, True), (Template, False)):
+            template = factory(body, keep_source=True)
+            self.assertEqual(template(a={'b': 1}), u"<div>1</div>")
+            self.assertEqual(
+                "('a', 'b', ), _static_" in template.source, cached)
+
+
+class TestExists(unittest.TestCase):
+    def setUp(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+        zope.component.testing.setUp(self)
+        provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def render(self, body, **options):
+        from z3c.pt.pagetemplate import PageTemplate
+        return PageTemplate(body)(**options)
+
+    def test_exists(self):
+        class Context(object):
+            title = u"Title"
+
+        class Container(object):
+            def __getitem__(self, name):
+                return {'item': Context()}[name]
+
+        body = (u"<div>${exists: options/a/title} ${exists: options/a/x} "
+                u"${exists: options/b/item/title} ${exists: options/b/x/y} "
+                u"${exists: options/c/items} ${exists: options/c/x} "
+                u"${exists: missing/x} ${python: exists('options/c/x')}"
+                u"</div>")
+        self.assertEqual(
+            self.render(body, a=Context(), b=Container(), c={}),
+            u"<div>1 0 1 0 1 0 0 0</div>")
+
+    def test_adapter(self):
+        from zope.component import provideAdapter
+        from zope.interface import implementer
+        from zope.location.interfaces import LocationError
+        from zope.traversing.interfaces import ITraversable
+
+        class Folder(object):
+            def __init__(self, exc=None):
+                self.exc = exc
+
+        @implementer(ITraversable)
+        class Traverser(object):
+            def __init__(self, context, request=None):
+                self.context = context
+
+            def traverse(self, name, further_path):
+                if name == 'item':
+                    return name
+                exc = self.context.exc
+                raise exc(name)
+
+        provideAdapter(Traverser, (Folder, ), ITraversable)
+        body = u"<div>${exists: options/folder/item} " \
+               u"${exists: options/folder/x}</div>"
+        for exc in LocationError, TypeError, KeyError:
+            self.assertEqual(
+                self.render(body, folder=Folder(exc)), u"<div>1 0</div>")
+        self.assertRaises(
+            ValueError, self.render, body, folder=Folder(ValueError))
+
+    def test_trusted(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        from zope.security.checker import NamesChecker
+        from zope.security.checker import ProxyFactory
+
+        class Context(object):
+            title = u"Title"
+            secret = u"Secret"
+
+        context = ProxyFactory(Context(), NamesChecker(['title']))
+        body = u"<div>${exists: context/title} ${exists: context/secret}</div>"
+        self.assertEqual(
+            PageTemplate(body).render(context=context), u"<div>1 0</div>")
+        self.assertEqual(
+            PageTemplate(body, trusted=True).render(context=context),
+            u"<div>1 1</div>")
+
+    def test_custom_nocall(self):
+        from chameleon.astutil import Symbol
+        from z3c.pt.expressions import NocallExpr
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class RecordingNocallExpr(NocallExpr):
+            traverser = Symbol(record_traverse)
+
+        del traversed[:]
+        body = u"<div>${exists: options/x}</div>"
+        for profile in (False, True):
+            template = PageTemplate(
+                body, profile=profile, expression_types=dict(
+                    PageTemplate.expression_types,
+                    nocall=RecordingNocallExpr))
+            self.assertEqual(template(), u"<div>1</div>")
+        self.assertEqual(traversed, [('x', ), ('x', )])
+        self.assertEqual(self.render(body), u"<div>0</div>")
+
+
+class TestPureExpr(unittest.TestCase):
+    def setUp(self):
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def _makeRequest(self):
+        class Request(object):
+            response = None
+
+            def __init__(self):
+                self.annotations = {}
+
+        return Request()
+
+    def _makeContext(self):
+        class Context(object):
+            calls = 0
+
+            def title(self):
+                self.calls += 1
+                return u"Title %d" % self.calls
+
+        return Context()
+
+    def test_request(self):
+        from z3c.pt.memo import get_memo
+        from z3c.pt.pagetemplate import PageTemplate
+        body = u"<div>${pure: context/title} ${pure: context/title}</div>"
+        first = PageTemplate(body)
+        second = PageTemplate(body + u" ")
+        request = self._makeRequest()
+        context = self._makeContext()
+        self.assertEqual(first.render(context=context, request=request),
+                         u"<div>Title 1 Title 1</div>")
+        self.assertEqual(second.render(context=context, request=request),
+                         u"<div>Title 1 Title 1</div> ")
+        memo = get_memo(request)
+        self.assertEqual((memo.hits, memo.misses), (3, 1))
+
+        # Another context or request is traversed again
+        other = self._makeContext()
+        self.assertEqual(first.render(context=other, request=request),
+                         u"<div>Title 1 Title 1</div>")
+        self.assertEqual(
+            first.render(context=context, request=self._makeRequest()),
+            u"<div>Title 2 Title 2</div>")
+
+    def test_render(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(
+            u"<div>${pure: context/title} ${context/title}</div>")
+        context = self._makeContext()
+        self.assertEqual(template.render(context=context),
+                         u"<div>Title 1 Title 2</div>")
+        self.assertEqual(template.render(context=context),
+                         u"<div>Title 3 Title 4</div>")
+
+    def test_trusted(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        from zope.location.interfaces import LocationError
+        from zope.security.checker import NamesChecker
+        from zope.security.checker import ProxyFactory
+
+        class Context(object):
+            secret = u"Secret"
+
+        context = ProxyFactory(Context(), NamesChecker(()))
+        request = self._makeRequest()
+        body = u"<div>${pure: context/secret}</div>"
+        self.assertEqual(
+            PageTemplate(body, trusted=True).render(
+                context=context, request=request),
+            u"<div>Secret</div>")
+        self.assertRaises(
+            LocationError, PageTemplate(body).render,
+            context=context, request=request)
+
+
+class TestConstantFolding(unittest.TestCase):
+    body = u"""\
+<div>
+  <span tal:content="modules/os/sep" />
+  <span tal:content="modules/os.path/sep" />
+  <span tal:content="python: len(path('modules/os/getcwd')) > 0" />
+  <span tal:replace="nothing" />
+  <span tal:attributes="title nothing" />
+  <span tal:content="string:${nothing}-${modules/os/sep}" />
+  <span tal:define="modules options/modules"
+        tal:content="modules/os/sep" />
+</div>"""
+
+    def setUp(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.interface import implementer
+        from zope.security.proxy import removeSecurityProxy
+        from zope.traversing.interfaces import ITraversable
+        zope.component.testing.setUp(self)
+
+        log = self.log = []
+
+        @implementer(ITraversable)
+        class Traverser(object):
+            def __init__(self, context, request=None):
+                self.context = removeSecurityProxy(context)
+
+            def traverse(self, name, further_path):
+                log.append(name)
+                try:
+                    return self.context[name]
+                except (KeyError, TypeError, AttributeError):
+                    return getattr(self.context, name)
+
+        provideAdapter(Traverser, (Interface, ), ITraversable)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def render(self, template):
+        return template(modules={'os': {'sep': u"X"}})
+
+    def test_identical(self):
+        from z3c.pt.expressions import PathExpr
+        from z3c.pt.pagetemplate import PageTemplate
+
+        class UnfoldedPathExpr(PathExpr):
+            constant_bases = static_bases = ()
+
+        class UnfoldedTemplate(PageTemplate):
+            expression_types = dict(
+                PageTemplate.expression_types, path=UnfoldedPathExpr)
+
+        expected = self.render(UnfoldedTemplate(self.body))
+        self.assertTrue(u'<span>X</span>' in expected)
+        self.assertTrue(u'<span>True</span>' in expected)
+        self.assertEqual(self.render(PageTemplate(self.body)), expected)
+
+    def test_resolved_once(self):
+        # The paths from an unproxied base are traversed once
+        from z3c.pt.expressions import expression_cache
+        from z3c.pt.pagetemplate import PageTemplate
+        from z3c.pt.pagetemplate import template_cache
+        template_cache.clear()
+        expression_cache.clear()
+        template = PageTemplate(self.body, trusted=True)
+        self.render(template)
+        self.render(template)
+        self.assertEqual(self.log, [])
+
+        class Module(object):
+            @property
+            def sep(self):
+                log.append('sep')
+                return u"X"
+
+        import sys
+        log = []
+        sys.modules['z3c_pt_module'] = Module()
+        self.addCleanup(sys.modules.pop, 'z3c_pt_module')
+        template = PageTemplate(
+            u"<div>${modules/z3c_pt_module/sep}</div>", trusted=True)
+        self.assertEqual(template(), u"<div>X</div>")
+        self.assertEqual(template(), u"<div>X</div>")
+        self.assertEqual(log, ['sep'])
+
+    def test_proxied(self):
+        # The paths from a proxied base are traversed on every render
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(self.body)
+        self.render(template)
+        self.assertEqual(self.log, ['os', 'os.path', 'os', 'os'])
+        self.render(template)
+        self.assertEqual(len(self.log), 8)
+
+    def test_interaction(self):
+        from zope.component import provideAdapter
+        from zope.interface import Interface
+        from zope.security.checker import defineChecker
+        from zope.security.checker import NamesChecker
+        from zope.security.checker import ProxyFactory
+        from zope.security.interfaces import Unauthorized
+        from zope.security.management import endInteraction
+        from zope.security.management import newInteraction
+        from zope.security.management import setSecurityPolicy
+        from zope.security.simplepolicies import ParanoidSecurityPolicy
+        from zope.traversing.adapters import DefaultTraversable
+        from zope.traversing.interfaces import ITraversable
+        from z3c.pt.pagetemplate import PageTemplate
+
+        # The adapter of the test removes the security proxies
+        zope.component.testing.tearDown(self)
+        zope.component.testing.setUp(self)
+        provideAdapter(DefaultTraversable, (Interface, ), ITraversable)
+
+        # Only the manager has the permission
+        class Policy(ParanoidSecurityPolicy):
+            def checkPermission(self, permission, object):
+                return [p.principal.id for p in self.participations] == \
+                       ['manager']
+
+        class Principal(object):
+            def __init__(self, id):
+                self.id = id
+
+        class Participation(object):
+            interaction = None
+
+            def __init__(self, id):
+                self.principal = Principal(id)
+
+        class Module(object):
+            secret = u"Secret"
+
+        defineChecker(Module, NamesChecker(['secret'], 'test.Manage'))
+        self.addCleanup(setSecurityPolicy, setSecurityPolicy(Policy))
+        self.addCleanup(endInteraction)
+
+        modules = ProxyFactory({'module': Module()})
+        template = PageTemplate(
+            u"<div tal:define=\"modules options/modules\">"
+            u"${modules/module/secret}</div>")
+        for id in ('manager', 'anonymous'):
+            newInteraction(Participation(id))
+            try:
+                if id == 'manager':
+                    self.assertEqual(
+                        template(modules=modules), u"<div>Secret</div>")
+                else:
+                    self.assertRaises(
+                        Unauthorized, template, modules=modules)
+            finally:
+                endInteraction()
+
+    def test_nothing(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(u"<div tal:content=\"nothing\" />")
+        template.cook_check()
+        self.assertEqual(template(), u"<div></div>")
+
+    def test_nothing_defined(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(
+            u"<div tal:define=\"nothing python: lambda: 'called'\" "
+            u"tal:content=\"nothing\" />")
+        self.assertEqual(template(), u"<div>called</div>")
+
+
+class TestTrusted(unittest.TestCase):
+    def setUp(self):
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def _makeContext(self):
+        from zope.security.checker import NamesChecker
+        from zope.security.checker import ProxyFactory
+
+        class Context(object):
+            title = u"Title"
+            secret = u"Secret"
+
+            def method(self):
+                return u"Called"
+
+        return ProxyFactory(Context(), NamesChecker(['title']))
+
+    def render(self, body, **config):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(body, **config)
+        return template.render(context=self._makeContext())
+
+    def test_modules(self):
+        from zope.location.interfaces import LocationError
+        body = u"<div tal:content=\"modules/os/sep\" />"
+        self.assertRaises(LocationError, self.render, body)
+        self.assertEqual(self.render(body, trusted=True), u"<div>/</div>")
+        body = u"<div tal:content=\"python: modules['os'].sep\" />"
+        self.assertEqual(self.render(body, trusted=True), u"<div>/</div>")
+
+    def test_proxied(self):
+        from zope.location.interfaces import LocationError
+        body = u"<div tal:content=\"context/secret\" />"
+        self.assertRaises(LocationError, self.render, body)
+        self.assertEqual(
+            self.render(body, trusted=True), u"<div>Secret</div>")
+
+    def test_public(self):
+        body = u"<div tal:content=\"context/title\" />"
+        self.assertEqual(self.render(body), u"<div>Title</div>")
+        self.assertEqual(self.render(body, trusted=True), u"<div>Title</div>")
+
+    def test_nocall(self):
+        body = (u"<div tal:define=\"method nocall: context/method\""
+                u"     tal:content=\"python: method()\" />")
+        self.assertEqual(
+            self.render(body, trusted=True), u"<div>Called</div>")
+
+    def test_file(self):
+        from z3c.pt.pagetemplate import ViewPageTemplateFile
+        template = ViewPageTemplateFile("view.pt", trusted=True)
+        self.assertTrue(template.trusted)
+        import sys
+        self.assertTrue(template.builtins["modules"] is sys.modules)
+
+    def test_digest(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        body = u"<div tal:content=\"options/title\" />"
+        self.assertNotEqual(
+            PageTemplate(body).digest(body, []),
+            PageTemplate(body, trusted=True).digest(body, []))
+
+
+class TestContentProviders(unittest.TestCase):
+    body = u"""\
+<div>
+  <p tal:replace="structure provider: first" />
+  <p tal:replace="structure provider: second" />
+</div>"""
+
+    def setUp(self):
+        from z3c.pt.expressions import provider_factories
+        zope.component.testing.setUp(self)
+        provider_factories.clear()
+        self.log = []
+        self.provide("first")
+        self.provide("second")
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def provide(self, name, output=None):
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import Interface
+
+        log = self.log
+
+        class Provider(object):
+            def __init__(self, context, request, view):
+                pass
+
+            def update(self):
+                log.append("update " + name)
+
+            def render(self):
+                log.append("render " + name)
+                return output or u"<%s />" % name
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface),
+            IContentProvider, name=name)
+
+    def render(self, **config):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(self.body, **config)
+        return template.render(context=None, view=None)
+
+    def test_interleaved(self):
+        result = self.render()
+        self.assertEqual(self.log, [
+            "update first", "render first",
+            "update second", "render second"])
+        self.assertEqual(result, "<div>\n  <first />\n  <second />\n</div>")
+
+    def test_batched(self):
+        result = self.render(batch_providers=True)
+        self.assertEqual(self.log, [
+            "update first", "update second",
+            "render first", "render second"])
+        self.assertEqual(result, "<div>\n  <first />\n  <second />\n</div>")
+
+    def test_batched_escaped(self):
+        self.provide("escaped", u"<b title=\"'x'\">x & y</b>")
+        self.body = u"""\
+<div title="${provider: escaped}" alt='${provider: escaped}'>
+  <p tal:content="provider: escaped" />
+  ${provider: escaped}
+  <p tal:replace="structure provider: escaped" />
+</div>"""
+        expected = self.render()
+        self.assertTrue(u"&lt;b" in expected)
+        self.assertEqual(self.render(batch_providers=True), expected)
+
+    def test_factory_cache(self):
+        from z3c.pt.expressions import provider_factories
+        self.render()
+        self.assertEqual(
+            sorted(key[0] for key in provider_factories), [
+                "first", "second"])
+
+        # Registering a component invalidates the cache
+        self.provide("second", u"<changed />")
+        self.assertTrue("<changed />" in self.render())
+
+    def test_lookup_error(self):
+        from zope.contentprovider.interfaces import ContentProviderLookupError
+        self.body = u"<div tal:replace=\"structure provider: missing\" />"
+        self.assertRaises(ContentProviderLookupError, self.render)
+
+    def test_profile(self):
+        from z3c.pt import profile
+        profile.reset()
+        self.render(profile=True)
+        self.assertEqual(
+            sorted(entry[:5] for entry in profile.stats()), [
+                ('<string>', 2, 'provider', 'first', 1),
+                ('<string>', 3, 'provider', 'second', 1)])
+
+
+class TestFragmentCache(unittest.TestCase):
+    body = u"""\
+<div>
+  <p tal:replace="structure provider: cached" />
+</div>"""
+
+    layout = u"""\
+<div metal:define-macro="portlet">
+  <h2 metal:define-slot="header" />
+  <p>${options/count}</p>
+</div>"""
+
+    page = u"""\
+<div metal:use-macro="python: options['layout'].macros['portlet']">
+  <h2 metal:fill-slot="header">${options/title}</h2>
+</div>"""
+
+    def setUp(self):
+        import z3c.pt
+        from z3c.pt.expressions import provider_factories
+        from z3c.pt.fragment import fragment_cache
+        zope.component.testing.setUp(self)
+        zope.configuration.xmlconfig.XMLConfig('configure.zcml', z3c.pt)()
+        provider_factories.clear()
+        fragment_cache.clear()
+        fragment_cache.invalidate()
+        self.log = []
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def provide(self, key=lambda: 1, ttl=None):
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import Interface
+
+        log = self.log
+
+        class Provider(object):
+            fragment_ttl = ttl
+
+            def __init__(self, context, request, view):
+                pass
+
+            def fragment_key(self):
+                return key()
+
+            def update(self):
+                log.append("update")
+
+            def render(self):
+                log.append("render")
+                return u"<p>%d</p>" % len(log)
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface),
+            IContentProvider, name="cached")
+
+    def render(self, **config):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(self.body, **config)
+        return template.render(context=None, view=None)
+
+    def test_provider(self):
+        from z3c.pt.fragment import fragment_cache
+        self.provide()
+        self.assertEqual(self.render(), self.render())
+        self.assertEqual(self.log, ["update", "render"])
+        stats = fragment_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+        fragment_cache.invalidate("cached")
+        self.assertTrue(u"<p>4</p>" in self.render())
+
+    def test_provider_key(self):
+        keys = [1, 2, 1, None, None]
+        self.provide(key=lambda: keys.pop(0))
+        for i in range(5):
+            self.render()
+        self.assertEqual(self.log, ["update", "render"] * 4)
+
+    def test_provider_ttl(self):
+        import time
+        self.provide(ttl=0.01)
+        self.render()
+        time.sleep(0.02)
+        self.render()
+        self.assertEqual(self.log, ["update", "render"] * 2)
+
+    def test_provider_batched(self):
+        self.provide()
+        expected = self.render()
+        self.assertEqual(self.render(batch_providers=True), expected)
+        self.assertEqual(self.log, ["update", "render"])
+
+    def _makeLayout(self, key=lambda econtext: econtext['options']['title']):
+        from z3c.pt.pagetemplate import PageTemplate
+        return PageTemplate(self.layout, cached_macros={
+            'portlet': (key, None)})
+
+    def test_macro(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        layout = self._makeLayout()
+        page = PageTemplate(self.page)
+        outputs = [page(layout=layout, title=title, count=i)
+                   for i, title in enumerate(("a", "a", "b"))]
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertTrue(u"<h2>a</h2>" in outputs[0])
+        self.assertTrue(u"<p>0</p>" in outputs[0])
+        self.assertTrue(u"<h2>b</h2>" in outputs[2])
+        self.assertTrue(u"<p>2</p>" in outputs[2])
+
+    def test_macro_uncached(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        layout = self._makeLayout(key=lambda econtext: None)
+        page = PageTemplate(self.page)
+        outputs = [page(layout=layout, title="a", count=i) for i in (0, 1)]
+        self.assertNotEqual(outputs[0], outputs[1])
+
+    def test_macro_missing(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        self.assertRaises(
+            KeyError, PageTemplate, self.layout, cached_macros={
+                'missing': (lambda econtext: 1, None)})
+
+
+class TestRenderAsync(unittest.TestCase):
+    body = u"""\
+<div>
+  <p tal:replace="structure provider: first" />
+  <p tal:replace="structure provider: second" />
+  <p tal:replace="structure provider: third" />
+</div>"""
+
+    delay = 0.1
+
+    def setUp(self):
+        from z3c.pt.expressions import provider_factories
+        zope.component.testing.setUp(self)
+        provider_factories.clear()
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def provide(self, name, sleep=None):
+        from zope.component import provideAdapter
+        from zope.contentprovider.interfaces import IContentProvider
+        from zope.interface import Interface
+
+        delay = self.delay
+
+        class Provider(object):
+            def __init__(self, context, request, view):
+                self.output = None
+
+            def update(self):
+                self.output = u"<%s />" % name
+                if sleep is not None:
+                    return sleep(delay)
+
+            def render(self):
+                if sleep is not None:
+                    return sleep(delay, result=self.output)
+                return self.output
+
+        provideAdapter(
+            Provider, (Interface, Interface, Interface),
+            IContentProvider, name=name)
+
+    def run_async(self, coroutine):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_identical(self):
+        import sys
+        import time
+        if sys.version_info < (3, 5):
+            return
+
+        import asyncio
+        from z3c.pt.pagetemplate import PageTemplate
+
+        # The output of a provider which is not inserted as structure
+        # is escaped
+        template = PageTemplate(self.body.replace(
+            "structure provider: third", "provider: third"))
+
+        for name in ("first", "second", "third"):
+            self.provide(name)
+        expected = template.render(context=None, view=None)
+        self.assertTrue(u"&lt;third /&gt;" in expected)
+
+        for name in ("first", "second", "third"):
+            self.provide(name, asyncio.sleep)
+        t = time.time()
+        result = self.run_async(
+            template.render_async(context=None, view=None))
+        elapsed = time.time() - t
+
+        self.assertEqual(result, expected)
+        self.assertTrue(u"<second />" in result)
+
+        # Three providers sleep twice each; the updates and the renders
+        # run concurrently.
+        self.assertTrue(elapsed < self.delay * 4, elapsed)
+
+    def test_bound(self):
+        import sys
+        if sys.version_info < (3, 5):
+            return
+
+        import asyncio
+        from z3c.pt.pagetemplate import ViewPageTemplate
+
+        class View(object):
+            request = None
+            context = None
+            template = ViewPageTemplate(self.body)
+
+        for name in ("first", "second", "third"):
+            self.provide(name, asyncio.sleep)
+        result = self.run_async(View().template.render_async())
+        self.assertEqual(
+            result,
+            u"<div>\n  <first />\n  <second />\n  <third />\n</div>")
+
+    def test_no_providers(self):
+        import sys
+        if sys.version_info < (3, 5):
+            return
+
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(u"<div>${title}</div>")
+        self.assertEqual(
+            self.run_async(template.render_async(title=u"Hello")),
+            u"<div>Hello</div>")
+
+        # The batch is only used for the first template
+        from z3c.pt.expressions import pop_provider_batch
+        self.assertTrue(pop_provider_batch() is None)
+
+
+class TestRenderIter(unittest.TestCase):
+    body = u"""\
+<ul>
+  <li tal:repeat="item python: items()">${item}</li>
+</ul>"""
+
+    def setUp(self):
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def _makeOne(self, body=None, **config):
+        from z3c.pt.pagetemplate import PageTemplate
+        return PageTemplate(body or self.body, **config)
+
+    def test_chunks(self):
+        template = self._makeOne()
+        items = lambda: range(100)
+        chunks = list(template.render_iter(64, items=items))
+        self.assertTrue(len(chunks) > 10)
+        self.assertTrue(min(map(len, chunks[:-1])) >= 64)
+        self.assertEqual(u"".join(chunks), template.render(items=items))
+
+    def test_streaming(self):
+        from z3c.pt import stream
+        if stream.greenlet is None:
+            return
+
+        received = []
+
+        def check(i):
+            if i == 50:
+                self.assertTrue(received)
+            return i
+
+        template = self._makeOne(u"""\
+<ul>
+  <li tal:repeat="item python: range(100)">${python: check(item)}</li>
+</ul>""")
+        for chunk in template.render_iter(64, check=check):
+            received.append(chunk)
+
+    def test_buffered(self):
+        from z3c.pt import stream
+        greenlet = stream.greenlet
+        stream.greenlet = None
+        try:
+            template = self._makeOne()
+            items = lambda: range(100)
+            chunks = list(template.render_iter(64, items=items))
+        finally:
+            stream.greenlet = greenlet
+        self.assertEqual(set(map(len, chunks[:-1])), set([64]))
+        self.assertEqual(u"".join(chunks), template.render(items=items))
+
+    def test_on_error(self):
+        template = self._makeOne(u"""\
+<div>
+  <p tal:repeat="i python: range(10)">${i}</p>
+  <p tal:on-error="string:error">${i}${python: 1 / 0}</p>
+</div>""")
+        output = u"".join(template.render_iter(1024))
+        self.assertEqual(output, template.render())
+        self.assertTrue(u"<p>error</p>" in output)
+
+    def test_nested(self):
+        inner = self._makeOne(u"<b>${options/text}</b>")
+        outer = self._makeOne(
+            u"<div tal:content=\"structure python: inner(text='a' * 100)\" />")
+        chunks = list(outer.render_iter(16, inner=inner))
+        self.assertEqual(u"".join(chunks), outer.render(inner=inner))
+
+    def test_view(self):
+        from z3c.pt.pagetemplate import ViewPageTemplate
+
+        class View(object):
+            context = None
+            request = None
+            template = ViewPageTemplate(u"""\
+<ul>
+  <li tal:repeat="item python: options['items']()">${item}</li>
+</ul>""")
+
+        view = View()
+        items = lambda: range(100)
+        chunks = list(view.template.render_iter(64, items=items))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(u"".join(chunks), view.template(items=items))
+
+
+class TestTranslation(unittest.TestCase):
+    body = u"""\
+<div xmlns:i18n="http://xml.zope.org/namespaces/i18n"
+     i18n:domain="test">
+  <p i18n:translate="">Hello</p>
+  <p tal:content="options/message" />
+</div>"""
+
+    def setUp(self):
+        from zope import i18n
+        from zope.component import provideUtility
+        from zope.i18n.interfaces import INegotiator
+        from zope.i18n.interfaces import ITranslationDomain
+        from zope.interface import implementer
+
+        zope.component.testing.setUp(self)
+        self.allowed_languages = i18n.ALLOWED_LANGUAGES
+        i18n.ALLOWED_LANGUAGES = ('de', )
+        self.log = log = []
+
+        @implementer(INegotiator)
+        class Negotiator(object):
+            def getLanguage(self, langs, request):
+                log.append("negotiate")
+                return langs[0]
+
+        @implementer(ITranslationDomain)
+        class Domain(object):
+            domain = "test"
+
+            def translate(self, msgid, mapping=None, context=None,
+                          target_language=None, default=None,
+                          msgid_plural=None, default_plural=None,
+                          number=None):
+                log.append(msgid)
+                text = u"%s:%s" % (target_language, msgid)
+                return i18n.interpolate(text, mapping)
+
+        self.domain = Domain()
+        provideUtility(Negotiator(), INegotiator)
+        provideUtility(self.domain, ITranslationDomain, "test")
+
+    def tearDown(self):
+        from zope import i18n
+        i18n.ALLOWED_LANGUAGES = self.allowed_languages
+        zope.component.testing.tearDown(self)
+
+    def _makeOne(self, **config):
+        from z3c.pt.pagetemplate import PageTemplate
+        return PageTemplate(self.body, **config)
+
+    def _makeRequest(self):
+        class Request(object):
+            response = None
+
+            def __init__(self):
+                self.annotations = {}
+
+        return Request()
+
+    def test_shared_by_request(self):
+        from zope.i18nmessageid import Message
+        request = self._makeRequest()
+        message = Message(u"greeting", u"test")
+        template = self._makeOne()
+        for i in range(3):
+            result = template(request=request, message=message)
+            self.assertTrue(u"de:Hello" in result)
+            self.assertTrue(u"de:greeting" in result)
+        self.assertEqual(self.log.count("negotiate"), 1)
+        self.assertEqual(self.log.count(u"Hello"), 3)
+
+    def test_memoize(self):
+        from zope.i18nmessageid import Message
+        request = self._makeRequest()
+        template = self._makeOne(memoize_translations=True)
+        for name in (u"World", u"World", u"Zope"):
+            message = Message(
+                u"greeting ${name}", u"test", mapping={'name': name})
+            result = template(request=request, message=message)
+            self.assertTrue(u"de:greeting %s" % name in result)
+        self.assertEqual(self.log.count(u"Hello"), 1)
+        self.assertEqual(self.log.count(u"greeting ${name}"), 2)
+
+    def test_no_annotations(self):
+        template = self._makeOne()
+        for i in range(2):
+            template(message=u"")
+        self.assertEqual(self.log.count("negotiate"), 2)
+
+    def test_variant(self):
+        from zope.i18nmessageid import Message
+        message = Message(u"greeting", u"test")
+        template = self._makeOne(languages=('de', ))
+        for i in range(3):
+            result = template(request=self._makeRequest(), message=message)
+            self.assertTrue(u"de:Hello" in result)
+            self.assertTrue(u"de:greeting" in result)
+
+        # The static message is translated when the variant is compiled
+        self.assertEqual(self.log.count(u"Hello"), 1)
+        self.assertEqual(self.log.count(u"greeting"), 3)
+
+    def test_variant_other_language(self):
+        template = self._makeOne(languages=('en', ))
+        for i in range(3):
+            result = template(message=u"")
+            self.assertTrue(u"de:Hello" in result)
+        self.assertEqual(self.log.count(u"Hello"), 3)
+
+    def test_variant_catalog_reloaded(self):
+        class Catalog(object):
+            _catalog = {}
+
+        catalog = Catalog()
+        self.domain._data = {'de-test': catalog}
+        template = self._makeOne(languages=('de', ))
+        for i in range(2):
+            template(message=u"")
+        self.assertEqual(self.log.count(u"Hello"), 1)
+
+        catalog._catalog = {}
+        for i in range(2):
+            template(message=u"")
+        self.assertEqual(self.log.count(u"Hello"), 2)
+
+    def test_variant_domain_registered(self):
+        from zope.component import provideUtility
+        from zope.i18n.interfaces import ITranslationDomain
+        from zope.i18n.simpletranslationdomain import \
+             SimpleTranslationDomain
+
+        template = self._makeOne(languages=('de', ))
+        self.assertTrue(u"de:Hello" in template(message=u""))
+
+        domain = SimpleTranslationDomain(
+            'test', {('de', u'Hello'): u'Hallo'})
+        provideUtility(domain, ITranslationDomain, "test")
+        self.assertTrue(u"Hallo" in template(message=u""))
+        self.assertEqual(self.log.count(u"Hello"), 1)
+
+    def test_variant_template_file(self):
+        import os
+        from z3c.pt.pagetemplate import PageTemplateFile
+        here = os.path.dirname(__file__)
+        template = PageTemplateFile(
+            os.path.join(here, 'i18n.pt'), languages=('de', ))
+        for i in range(2):
+            result = template()
+        self.assertTrue(u"de:Hello" in result)
+        self.assertEqual(self.log.count(u"Hello"), 1)
+
+
+class TestBinding(unittest.TestCase):
+    def setUp(self):
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        zope.component.testing.tearDown(self)
+
+    def _makeClass(self, **attrs):
+        from z3c.pt.pagetemplate import PageTemplate
+        attrs['template'] = PageTemplate(
+            u"<div>${options/text} ${context/name}</div>")
+        return type('Class', (object, ), attrs)
+
+    def test_bound(self):
+        instance = self._makeClass(name=u"Name")()
+        bound = instance.template
+        self.assertTrue(bound.im_self is type(instance).template)
+        self.assertEqual(bound(text=u"Hello"), u"<div>Hello Name</div>")
+        self.assertEqual(bound.im_func(text=u"Hello"), bound(text=u"Hello"))
+        self.assertRaises(AttributeError, setattr, bound, 'im_self', None)
+
+    def test_render(self):
+        # The constructor takes a render function
+        from z3c.pt.pagetemplate import BoundPageTemplate
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(u"<div>${options/text}</div>")
+
+        def render(**kwargs):
+            kwargs['text'] = kwargs['text'].upper()
+            return template(**kwargs)
+
+        bound = BoundPageTemplate(template, render)
+        self.assertTrue(bound.im_self is template)
+        self.assertEqual(bound(text=u"Hello"), u"<div>HELLO</div>")
+        self.assertEqual(bound.im_func(text=u"Hello"), u"<div>HELLO</div>")
+
+    def test_not_kept(self):
+        import copy
+        import gc
+        import weakref
+        cls = self._makeClass(name=u"Name")
+        instance = cls()
+        instance.template(text=u"Hello")
+        self.assertEqual(instance.__dict__, {})
+
+        # The instance can still be copied
+        self.assertEqual(copy.deepcopy(instance).__dict__, {})
+
+        # ... and is freed without a garbage collection
+        gc.disable()
+        try:
+            ref = weakref.ref(instance)
+            del instance
+            self.assertTrue(ref() is None)
+        finally:
+            gc.enable()
+
+    def test_slots(self):
+        cls = self._makeClass(__slots__=(), name=u"Name")
+        self.assertEqual(cls().template(text=u"Hello"),
+                         u"<div>Hello Name</div>")
+
+    def test_view(self):
+        from z3c.pt.pagetemplate import ViewPageTemplate
+
+        class View(object):
+            context = u"Context"
+            request = None
+            index = ViewPageTemplate(u"<div>${context} ${options/text}</div>")
+
+        view = View()
+        self.assertEqual(view.index(text=u"Hello"),
+                         u"<div>Context Hello</div>")
+        self.assertEqual(View.index(view, text=u"Hello"),
+                         u"<div>Context Hello</div>")
+        self.assertEqual(View.index(view, context=u"Other", text=u"Hello"),
+                         u"<div>Other Hello</div>")
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        from chameleon.loader import MemoryLoader
+        from z3c.pt.cache import TemplateCache
+        self.cache = TemplateCache(loader=MemoryLoader())
+
+    def _makeOne(self, cls=None, **config):
+        import os
+        from z3c.pt.pagetemplate import PageTemplateFile
+        filename = os.path.join(os.path.dirname(__file__), 'view.pt')
+        template = (cls or PageTemplateFile)(filename, **config)
+        template.loader = self.cache
+        return template
+
+    def test_shared_between_classes(self):
+        from z3c.pt.pagetemplate import ViewPageTemplateFile
+        self._makeOne().cook_check()
+
+        def compile(body, builtins):
+            raise AssertionError("template was compiled again")
+
+        for cls in (None, ViewPageTemplateFile):
+            template = self._makeOne(cls)
+            template._compile = compile
+            template.cook_check()
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertTrue(stats['bytes'] > 0)
+
+    def test_configuration(self):
+        from z3c.pt.pagetemplate import PageTemplateFile
+        self._makeOne().cook_check()
+        self._makeOne(strict=True).cook_check()
+        self._makeOne(expression_types=dict(
+            PageTemplateFile.expression_types, foo=None)).cook_check()
+        self.assertEqual(self.cache.stats()['entries'], 3)
+
+    def test_bounded(self):
+        from chameleon.loader import MemoryLoader
+        from z3c.pt.cache import TemplateCache
+        self.cache = TemplateCache(maxbytes=1, loader=MemoryLoader())
+        self._makeOne().cook_check()
+        self._makeOne(strict=True).cook_check()
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (1, 1))
+
+    def test_digest_value(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        from z3c.pt.pagetemplate import digest_value
+        value = digest_value(PageTemplate.expression_types)
+        self.assertTrue("z3c.pt.expressions.PathExpr" in value)
+        self.assertFalse(" at 0x" in value)
+
+    def test_same_name(self):
+        import ast
+        from chameleon.codegen import template
+        from z3c.pt import expressions
+        from z3c.pt.pagetemplate import PageTemplate
+
+        def make(value):
+            class PathExpr(expressions.PathExpr):
+                def translate(self, string, target):
+                    return template(
+                        "target = VALUE", target=target,
+                        VALUE=ast.Str(s=value))
+            return dict(PageTemplate.expression_types, path=PathExpr)
+
+        for value in ("first", "second"):
+            pt = PageTemplate(
+                "<div>${foo}</div>", expression_types=make(value))
+            pt.loader = self.cache
+            self.assertEqual(pt(), "<div>%s</div>" % value)
+
+    def test_subclass(self):
+        from z3c.pt.pagetemplate import PageTemplateFile
+
+        class Template(PageTemplateFile):
+            def parse(self, body):
+                raise AssertionError("not compiled")
+
+        digest = self._makeOne().digest("", ())
+        self.assertNotEqual(self._makeOne(Template).digest("", ()), digest)
+
+
+class TestSingleFlight(unittest.TestCase):
+    threads = 8
+
+    def _concurrently(self, func):
+        import threading
+        start = threading.Event()
+        results = []
+
+        def run():
+            start.wait()
+            results.append(func())
+
+        threads = [threading.Thread(target=run) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def _makeOne(self, cooked, **kwargs):
+        import os
+        import time
+        from z3c.pt.pagetemplate import PageTemplateFile
+
+        class Template(PageTemplateFile):
+            def cook(self, body):
+                cooked.append(body)
+                # Give the other threads a chance to try as well
+                time.sleep(0.05)
+                super(Template, self).cook(body)
+
+        here = os.path.dirname(__file__)
+        return Template(os.path.join(here, 'helloworld.pt'), **kwargs)
+
+    def test_cook(self):
+        cooked = []
+        template = self._makeOne(cooked)
+        results = self._concurrently(template)
+        self.assertEqual(len(results), self.threads)
+        self.assertEqual(len(set(results)), 1)
+        self.assertTrue(u"Hello World!" in results[0])
+        self.assertEqual(len(cooked), 1)
+
+    def test_auto_reload(self):
+        cooked = []
+        template = self._makeOne(cooked, auto_reload=True)
+        self._concurrently(template)
+        self.assertEqual(len(cooked), 1)
+
+        # The file is read again after it changes
+        template._v_last_read = 0
+        self._concurrently(template)
+        self.assertEqual(len(cooked), 2)
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'test.pt')
+        self._write(u"<div>Hello</div>")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def _write(self, body, mtime=None):
+        import os
+        with open(self.filename, 'w') as f:
+            f.write(body)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def _makeOne(self, watcher):
+        from z3c.pt.pagetemplate import PageTemplateFile
+        template = PageTemplateFile(self.filename)
+        template.cook_check()
+        watcher.watch(template)
+        return template
+
+    def test_polling(self):
+        from z3c.pt.watch import PollingWatcher
+        watcher = PollingWatcher(interval=60)
+        self.addCleanup(watcher.stop)
+        template = self._makeOne(watcher)
+        self.assertEqual(watcher.check(), [])
+        self._write(u"<div>Goodbye</div>", mtime=1)
+        self.assertEqual(watcher.check(), [self.filename])
+        self.assertEqual(template().strip(), u"<div>Goodbye</div>")
+        self.assertEqual(watcher.check(), [])
+
+    def test_inotify(self):
+        import time
+        from z3c.pt.watch import InotifyWatcher
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError):
+            return
+        self.addCleanup(watcher.stop)
+        template = self._makeOne(watcher)
+        self.assertTrue(template._cooked)
+        self._write(u"<div>Goodbye</div>")
+        for i in range(200):
+            if not template._cooked:
+                break
+            time.sleep(0.01)
+        self.assertEqual(template().strip(), u"<div>Goodbye</div>")
+
+    def test_fork(self):
+        import os
+        import time
+        from z3c.pt import watch
+        if not hasattr(os, 'fork'):
+            return
+        try:
+            watcher = watch._watcher = watch.InotifyWatcher()
+        except (OSError, AttributeError):
+            watcher = watch._watcher = watch.PollingWatcher(interval=0.01)
+        self.addCleanup(setattr, watch, '_watcher', None)
+        self.addCleanup(watcher.stop)
+        template = self._makeOne(watcher)
+        thread = watcher._thread
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                if not hasattr(os, 'register_at_fork'):
+                    watcher.watch(template)
+                if watcher._thread is not thread and \
+                       watcher._thread.is_alive():
+                    self._write(u"<div>Goodbye</div>", mtime=1)
+                    for i in range(200):
+                        if not template._cooked:
+                            status = 0
+                            break
+                        time.sleep(0.01)
+            finally:
+                os._exit(status)
+
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+    def test_option(self):
+        from z3c.pt import watch
+        from z3c.pt.pagetemplate import PageTemplateFile
+        watcher = watch._watcher = watch.PollingWatcher(interval=60)
+        self.addCleanup(setattr, watch, '_watcher', None)
+        self.addCleanup(watcher.stop)
+        PageTemplateFile(self.filename).cook_check()
+        self.assertEqual(watcher.templates, {})
+        template = PageTemplateFile(self.filename, watch=True)
+        template.cook_check()
+        self.assertEqual(list(watcher.templates[self.filename].values()),
+                         [template])
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        from z3c.pt import profile
+        zope.component.testing.setUp(self)
+        profile.reset()
+
+    def tearDown(self):
+        from z3c.pt import profile
+        zope.component.testing.tearDown(self)
+        profile.reset()
+
+    def test_disabled(self):
+        from z3c.pt import profile
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(u"<div tal:content=\"options/title\" />")
+        template(title=u"Hello")
+        self.assertEqual(profile.stats(), [])
+
+    def test_file(self):
+        import os
+        from z3c.pt import profile
+        from z3c.pt.pagetemplate import PageTemplateFile
+        template = PageTemplateFile("view.pt", profile=True)
+        template.render(context=None, view=None, options={'test': u"Test"})
+        entries = sorted(entry[:5] for entry in profile.stats())
+        self.assertTrue(os.path.isabs(template.filename))
+        self.assertEqual(entries[0], (template.filename, 3, 'path', 'view', 1))
+        self.assertEqual(len(entries), 6)
+
+    def test_error(self):
+        from z3c.pt import profile
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(
+            u"<div tal:on-error=\"string:error\">"
+            u"<p tal:content=\"python: 1 / 0\" /></div>", profile=True)
+        self.assertEqual(template(), u"<div>error</div>")
+        self.assertEqual([entry[:5] for entry in profile.stats()], [
+            ('<string>', 1, 'python', '1 / 0', 1)])
+
+    def test_digest(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        body = u"<div tal:content=\"options/title\" />"
+        self.assertNotEqual(
+            PageTemplate(body).digest(body, []),
+            PageTemplate(body, profile=True).digest(body, []))
+
+
+class TestNames(unittest.TestCase):
+    def setUp(self):
+        import zope.component.testing
+        zope.component.testing.setUp(self)
+
+    def tearDown(self):
+        import zope.component.testing
+        zope.component.testing.tearDown(self)
+
+    def render(self, body, **kwargs):
+        from z3c.pt.pagetemplate import PageTemplate
+        options = kwargs.pop('options', {})
+        template = PageTemplate(body, keep_source=True, **kwargs)
+        # Repeated elements are separated by a newline
+        return template(**options).replace(u"\n", u""), template.source
+
+    def test_local(self):
+        result, source = self.render(
+            u"<div tal:define=\"x python: 1; y python: x + 1\">"
+            u"<p tal:define=\"x python: x + y\" tal:content=\"python: x\" />"
+            u"${python: x}</div>")
+        self.assertEqual(result, u"<div><p>3</p>1</div>")
+        self.assertFalse("getname('x')" in source)
+        self.assertFalse("getname('y')" in source)
+
+    def test_repeat(self):
+        result, source = self.render(
+            u"<ul tal:define=\"item python: 'outer'\">"
+            u"<li tal:repeat=\"item python: options['items']\">"
+            u"<b tal:define=\"item python: item * 2\""
+            u" tal:content=\"python: item\" />"
+            u"${python: item}</li>${python: item}</ul>",
+            options={'items': [1, 2]})
+        self.assertEqual(
+            result, u"<ul><li><b>2</b>1</li><li><b>4</b>2</li>outer</ul>")
+        self.assertFalse("getname('item')" in source)
+
+    def test_nested_repeat(self):
+        result, source = self.render(
+            u"<ul><li tal:repeat=\"i python: range(2)\">"
+            u"<b tal:repeat=\"j python: range(i + 1)\""
+            u" tal:content=\"python: (i, j)\" />${python: i}</li></ul>")
+        self.assertEqual(
+            result, u"<ul><li><b>(0, 0)</b>0</li>"
+            u"<li><b>(1, 0)</b><b>(1, 1)</b>1</li></ul>")
+        self.assertFalse("getname('i')" in source)
+        self.assertFalse("getname('j')" in source)
+
+    def test_compiler_internals(self):
+        # The values are looked up if not kept in the compiler's
+        # variables
+        from z3c.pt import names
+        uses_name = names.uses_name
+        names.uses_name = lambda nodes, name: False
+        try:
+            result, source = self.render(
+                u"<ul tal:define=\"items python: options['items']\">"
+                u"<li tal:repeat=\"item items\""
+                u" tal:content=\"python: item * 2\" /></ul>",
+                options={'items': [1, 2]})
+        finally:
+            names.uses_name = uses_name
+        self.assertEqual(result, u"<ul><li>2</li><li>4</li></ul>")
+        self.assertTrue("getname('item')" in source)
+        self.assertTrue("getname('items')" in source)
+
+    def test_free(self):
+        result, source = self.render(
+            u"<ul><li tal:repeat=\"i python: range(3)\""
+            u" tal:content=\"python: str(i * options['factor'])\" />"
+            u"</ul>", options={'factor': 2})
+        self.assertEqual(result, u"<ul><li>0</li><li>2</li><li>4</li></ul>")
+        self.assertEqual(source.count("econtext.get('options'"), 1)
+
+    def test_undefined(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        template = PageTemplate(
+            u"<ul><li tal:repeat=\"i python: range(2)\""
+            u" tal:content=\"python: i and undefined\" /></ul>")
+        self.assertRaises(NameError, template)
+
+    def test_builtin(self):
+        result, source = self.render(
+            u"<ul tal:define=\"global sorted python: reversed\">"
+            u"<li tal:repeat=\"i python: sorted([1, 2])\""
+            u" tal:content=\"python: str(i)\" /></ul>"
+            u"<p tal:repeat=\"i python: range(2)\""
+            u" tal:content=\"python: max(i, 0)\" />")
+        self.assertEqual(
+            result, u"<ul><li>2</li><li>1</li></ul><p>0</p><p>1</p>")
+        self.assertEqual(source.count("econtext.get('max', max)"), 1)
+
+    def test_path(self):
+        result, source = self.render(
+            u"<ul><li tal:repeat=\"i python: range(2)\""
+            u" tal:content=\"python: path('options/name') + \'\' * i\" />"
+            u"</ul>", options={'name': u"Bob"})
+        self.assertEqual(result, u"<ul><li>Bob</li><li>Bob</li></ul>")
+        self.assertEqual(source.count("econtext.get('path')"), 1)
+
+    def test_global(self):
+        result, source = self.render(
+            u"<div tal:define=\"x python: 1\">"
+            u"<p tal:define=\"global x python: x + 1\" />"
+            u"${python: x}</div>")
+        self.assertEqual(result, u"<div><p />2</div>")
+        self.assertTrue("getname('x')" in source)
+
+    def test_comprehension(self):
+        result, source = self.render(
+            u"<div tal:define=\"x python: 3\">"
+            u"${python: [x for x in range(2)]} ${python: x}</div>")
+        self.assertEqual(result, u"<div>[0, 1] 1</div>")
+
+    def test_on_error(self):
+        result, source = self.render(
+            u"<div tal:define=\"error python: 1\" tal:on-error=\"python:"
+            u" error.type.__name__\">${python: error} ${python: 1 / 0}</div>")
+        self.assertEqual(result, u"<div>ZeroDivisionError</div>")
+
+    def test_macro(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        macro = PageTemplate(
+            u"<div metal:define-macro=\"main\""
+            u" tal:define=\"global x python: 2\">"
+            u"<metal:slot define-slot=\"content\" /></div>")
+        result, source = self.render(
+            u"<div tal:define=\"x python: 1\">"
+            u"<div metal:use-macro=\"options/macro\">"
+            u"<p metal:fill-slot=\"content\" tal:content=\"python: x\" />"
+            u"</div>${python: x}</div>",
+            options={'macro': macro.macros['main']})
+        self.assertEqual(result, u"<div><div><p>2</p></div>2</div>")
+
+    def test_disabled(self):
+        result, source = self.render(
+            u"<div tal:define=\"x python: 1\">${python: x}</div>",
+            resolve_names=False)
+        self.assertEqual(result, u"<div>1</div>")
+        self.assertTrue("getname('x')" in source)
+
+    def test_digest(self):
+        from z3c.pt.pagetemplate import PageTemplate
+        body = u"<div tal:content=\"python: 1\" />"
+        self.assertNotEqual(
+            PageTemplate(body).digest(body, []),
+            PageTemplate(body, resolve_names=False).digest(body, []))
+
+
 def test_suite():
     import sys
     return unittest.findTestCases(sys.modules[__name__])
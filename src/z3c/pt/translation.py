@@ -0,0 +1,132 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+from zope import i18n
+
+from chameleon.i18n import fast_translate
+
+try:
+    from Missing import MV
+    MV  # pyflakes
+except ImportError:
+    MV = object()
+
+_marker = object()
+
+# Request annotation key
+KEY = 'z3c.pt.translation'
+
+
+class Translator(object):
+    """Translation function bound to a request.
+
+    The language negotiated for the request is computed on first use.
+
+      >>> translate = Translator(None)
+      >>> print(translate(u"msgid", default=u"Hello ${name}",
+      ...                 mapping={'name': u"World"}))
+      Hello World
+      >>> translate.language is None
+      True
+    """
+
+    __slots__ = 'request', '_language'
+
+    key = KEY
+
+    def __init__(self, request):
+        self.request = request
+        self._language = _marker
+
+    @property
+    def language(self):
+        language = self._language
+        if language is _marker:
+            try:
+                language = i18n.negotiate(self.request)
+            except:
+                language = None
+            self._language = language
+        return language
+
+    def __call__(self, msgid, domain=None, mapping=None,
+                 target_language=None, default=None, context=None):
+        if msgid is MV:
+            # Special case handling of Zope2's Missing.MV
+            # (Missing.Value) used by the ZCatalog but is
+            # unhashable
+            return
+
+        return fast_translate(
+            msgid, domain, mapping, self.request, target_language, default)
+
+
+class MemoizingTranslator(Translator):
+    """Translation function which remembers its translations for its
+    lifetime (usually that of the request).
+
+      >>> translate = MemoizingTranslator(None)
+      >>> print(translate(u"msgid", default=u"Hello"))
+      Hello
+      >>> len(translate.memo)
+      1
+    """
+
+    __slots__ = 'memo',
+
+    key = KEY + '.memo'
+
+    def __init__(self, request):
+        super(MemoizingTranslator, self).__init__(request)
+        self.memo = {}
+
+    def __call__(self, msgid, domain=None, mapping=None,
+                 target_language=None, default=None, context=None):
+        try:
+            # Messages compare equal to their message id; their own
+            # domain, default and mapping are included in the key.
+            key = (
+                msgid, domain, target_language, default,
+                getattr(msgid, 'domain', None),
+                getattr(msgid, 'default', None),
+                mapping and tuple(sorted(mapping.items())),
+                getattr(msgid, 'mapping', None) and
+                tuple(sorted(msgid.mapping.items())),
+                )
+            return self.memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable mapping values (or Missing.MV)
+            return super(MemoizingTranslator, self).__call__(
+                msgid, domain, mapping, target_language, default)
+
+        result = self.memo[key] = super(MemoizingTranslator, self).__call__(
+            msgid, domain, mapping, target_language, default)
+        return result
+
+
+def get_translator(request, factory=Translator):
+    """Return the translator for ``request``; it is kept in the
+    request annotations (if available) and shared by all templates
+    rendered for the request."""
+
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return factory(request)
+
+    translator = annotations.get(factory.key)
+    if translator is None:
+        translator = annotations[factory.key] = factory(request)
+
+    return translator
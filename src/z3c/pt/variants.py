@@ -0,0 +1,232 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compile a variant of a template for each target language.
+
+A template which is given a set of ``languages`` is compiled once
+more for each of them (on first use); in such a variant, the static
+messages of the template (``i18n:translate`` on text which contains
+neither names nor expressions, within an ``i18n:domain``) are
+translated at compile time and written out as text. Other messages
+are translated when the template is rendered, as usual.
+
+  >>> from zope.component import provideUtility
+  >>> from zope.i18n.simpletranslationdomain import SimpleTranslationDomain
+  >>> messages = {('de', u'Hello'): u'Hallo'}
+  >>> provideUtility(SimpleTranslationDomain('test', messages), name='test')
+
+  >>> from z3c.pt.pagetemplate import PageTemplate
+  >>> template = PageTemplate('''\\
+  ... <div i18n:domain="test">
+  ...   <p i18n:translate="">Hello</p>
+  ...   <p i18n:translate="">Hello ${options/name}</p>
+  ... </div>''', languages=('de', ))
+
+  >>> print(template.render(target_language='de', options={'name': 'Bob'}))
+  <div>
+    <p>Hallo</p>
+    <p>Hello Bob</p>
+  </div>
+
+Other languages are rendered by the template itself:
+
+  >>> print(template.render(target_language='fr', options={'name': 'Bob'}))
+  <div>
+    <p>Hello</p>
+    <p>Hello Bob</p>
+  </div>
+
+A variant is compiled again when the catalogs of the translation
+domains it uses are reloaded (or the domains registered again).
+Changes which this does not detect, e.g. to the messages of a simple
+translation domain, require a call to ``invalidate()``:
+
+  >>> messages[('de', u'Hello')] = u'Guten Tag'
+  >>> print(template.render(target_language='de', options={'name': 'Bob'}))
+  <div>
+    <p>Hallo</p>
+    ...
+  >>> invalidate()
+  >>> print(template.render(target_language='de', options={'name': 'Bob'}))
+  <div>
+    <p>Guten Tag</p>
+    ...
+"""
+import re
+import ast
+import copy
+import threading
+
+from zope.component import queryUtility
+from zope.i18n.interfaces import ITranslationDomain
+
+from chameleon.compiler import EmitText
+from chameleon.i18n import fast_translate
+from chameleon.loader import MemoryLoader
+from chameleon.nodes import Sequence
+from chameleon.nodes import Text
+
+from z3c.pt.names import NameResolvingCompiler
+
+# Variants are compiled for each template (the translations they
+# contain are not part of the template digest, so the compiled
+# programs can't be shared or kept on disk)
+loader = MemoryLoader()
+
+# Variants compiled before the current generation are compiled again
+# on next use (see ``invalidate``)
+_generation = 0
+
+re_whitespace = re.compile(r'\s+')
+
+
+def invalidate():
+    """Compile all variants again on next use."""
+
+    global _generation
+    _generation += 1
+
+
+def static_text(node):
+    """Return the text of ``node`` if it is static text (only),
+    otherwise ``None``."""
+
+    if isinstance(node, Text):
+        return node.value
+    if isinstance(node, Sequence):
+        parts = [static_text(item) for item in node.items]
+        if None not in parts:
+            return ''.join(parts)
+
+
+def signature(domains):
+    """Return the translation domains registered for ``domains`` and
+    their message catalogs; a catalog which is reloaded replaces its
+    messages."""
+
+    objects = []
+    for name in domains:
+        domain = queryUtility(ITranslationDomain, name)
+        objects.append(domain)
+        catalogs = getattr(domain, '_data', None) or {}
+        for key in sorted(catalogs):
+            catalog = catalogs[key]
+            objects.append(getattr(catalog, '_catalog', catalog))
+    return objects
+
+
+def unchanged(objects, other):
+    if len(objects) != len(other):
+        return False
+    for a, b in zip(objects, other):
+        if a is not b:
+            return False
+    return True
+
+
+class TranslatingCompiler(NameResolvingCompiler):
+    """Compiler which translates the static messages of the template
+    to ``language``; the names of the translation domains used are
+    returned by the compiled program as ``i18n_domains``."""
+
+    def __init__(self, language, *args, **kwargs):
+        # The template is compiled by the base class constructor
+        self.language = language
+        self.domains = set()
+        self._domains = [None]
+        self._contexts = [None]
+        super(TranslatingCompiler, self).__init__(*args, **kwargs)
+
+    def visit_MacroProgram(self, node):
+        functions = super(TranslatingCompiler, self).visit_MacroProgram(node)
+        result = functions[-1].value
+        result.keys.append(ast.Str(s='i18n_domains'))
+        result.values.append(ast.Tuple(
+            elts=[ast.Str(s=name) for name in sorted(self.domains)],
+            ctx=ast.Load()))
+        return functions
+
+    def visit_Domain(self, node):
+        self._domains.append(node.name)
+        try:
+            return super(TranslatingCompiler, self).visit_Domain(node)
+        finally:
+            self._domains.pop()
+
+    def visit_TxContext(self, node):
+        self._contexts.append(node.name)
+        try:
+            return super(TranslatingCompiler, self).visit_TxContext(node)
+        finally:
+            self._contexts.pop()
+
+    def visit_Translate(self, node):
+        domain = self._domains[-1]
+        text = static_text(node.node)
+        if not domain or text is None or self._contexts[-1] is not None:
+            return super(TranslatingCompiler, self).visit_Translate(node)
+
+        # This is how the message is computed when rendered
+        default = re_whitespace.sub(' ', text).strip()
+        msgid = node.msgid or default
+        if not msgid:
+            return []
+
+        self.domains.add(domain)
+        return [EmitText(fast_translate(
+            msgid, domain, None, None, self.language, default))]
+
+
+def current(variant):
+    """Return true if ``variant`` is up to date."""
+
+    return variant is not None and \
+           variant._i18n_generation == _generation and \
+           unchanged(variant._i18n_signature,
+                     signature(variant._i18n_domains))
+
+
+def get_variant(template, language):
+    """Return the variant of ``template`` for ``language``, compiling
+    it if needed."""
+
+    template.cook_check()
+
+    variants = template.__dict__.get('_v_variants')
+    if variants is not None:
+        variant = variants.get(language)
+        if current(variant):
+            return variant
+
+    # The variant is compiled by one thread at a time (see
+    # ``BaseTemplateFile.cook_check``)
+    lock = template.__dict__.setdefault('_v_cook_lock', threading.Lock())
+    with lock:
+        variants = template.__dict__.setdefault('_v_variants', {})
+        variant = variants.get(language)
+        if current(variant):
+            return variant
+
+        variant = copy.copy(template)
+        for name in ('_v_variants', '_v_cook_lock', '_v_builtins'):
+            variant.__dict__.pop(name, None)
+
+        variant.variant_language = language
+        variant.loader = loader
+        variant.watch = False
+        variant._i18n_generation = _generation
+        variant.cook(template._v_body)
+        variant._i18n_signature = signature(variant._i18n_domains)
+        variants[language] = variant
+
+    return variant
@@ -0,0 +1,304 @@
+##############################################################################
+#
+# Copyright (c) 2007 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Reload templates when their files change.
+
+Unlike ``auto_reload``, which checks the modification time of the
+template file on every render, a watcher is notified of changes in a
+background thread (using inotify on Linux, or by polling the watched
+files) and marks the templates of changed files as not cooked, such
+that they're read again on next use.
+
+In a process forked from one with a running watcher, the watcher
+state (including its thread) is set up again, such that the templates
+inherited from the parent process are still watched.
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import weakref
+import threading
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+log = logging.getLogger('z3c.pt')
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+class Watcher(object):
+    """Base class; subclasses detect changes and call ``changed``."""
+
+    def __init__(self):
+        self.templates = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = os.getpid()
+
+    def watch(self, template):
+        # Without fork handlers, the watcher is set up again in a
+        # forked process when it's next used
+        if self._pid != os.getpid():
+            self.reinit()
+
+        filename = template.filename
+        with self._lock:
+            templates = self.templates.get(filename)
+            if templates is None:
+                templates = self.templates[filename] = \
+                            weakref.WeakValueDictionary()
+                self.add(filename)
+            templates[id(template)] = template
+
+        if self._thread is None:
+            self.start()
+
+    def changed(self, filename):
+        """Invalidate the templates of ``filename``; returns the number
+        of templates invalidated."""
+
+        with self._lock:
+            templates = self.templates.get(filename)
+            templates = templates is not None and list(templates.values())
+
+        count = 0
+        for template in templates or ():
+            template._cooked = False
+            count += 1
+
+        if count:
+            log.debug("%s changed; %d template(s) invalidated." % (
+                filename, count))
+
+        return count
+
+    def add(self, filename):
+        """Called (with the lock held) for each new filename."""
+
+    def reinit(self):
+        """Set up the watcher again in a forked process; the thread of
+        the parent process is not running in the child."""
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = os.getpid()
+        self.reset()
+        with self._lock:
+            filenames = [
+                filename for filename, templates in self.templates.items()
+                if len(templates)]
+            for filename in filenames:
+                self.add(filename)
+
+        if filenames:
+            self.start()
+
+    def reset(self):
+        """Called to drop the state inherited from the parent process
+        before the filenames are added again."""
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            thread = threading.Thread(target=self.run, name=repr(self))
+            thread.daemon = True
+            self._thread = thread
+        thread.start()
+
+    def run(self):
+        raise NotImplementedError("Must be implemented by subclass.")
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+class PollingWatcher(Watcher):
+    """Checks the modification time of the watched files every
+    ``interval`` seconds."""
+
+    def __init__(self, interval=1.0):
+        super(PollingWatcher, self).__init__()
+        self.interval = interval
+        self.mtimes = {}
+        self._stopped = threading.Event()
+
+    def add(self, filename):
+        self.mtimes[filename] = self.mtime(filename)
+
+    def reset(self):
+        self._stopped = threading.Event()
+
+    def mtime(self, filename):
+        try:
+            return os.path.getmtime(filename)
+        except (IOError, OSError):
+            return 0
+
+    def check(self):
+        with self._lock:
+            mtimes = list(self.mtimes.items())
+
+        changed = []
+        for filename, mtime in mtimes:
+            current = self.mtime(filename)
+            if current != mtime:
+                self.mtimes[filename] = current
+                changed.append(filename)
+                self.changed(filename)
+
+        return changed
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(self.interval)
+            self.check()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+# Inotify event mask: a file was written, created, removed, renamed
+# or touched.
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+           IN_CREATE | IN_DELETE)
+
+IN_CLOEXEC = 0o2000000
+
+EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher(Watcher):
+    """Watches the directories of the watched files using inotify
+    (Linux only)."""
+
+    def __init__(self):
+        if ctypes is None or not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "Inotify is not available.")
+
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.init()
+
+        super(InotifyWatcher, self).__init__()
+        self.directories = {}
+        self.paths = set()
+        self._wakeup = os.pipe()
+
+    def init(self):
+        fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "Unable to initialize inotify.")
+        return fd
+
+    def add(self, filename):
+        path = os.path.dirname(filename)
+        if path in self.paths:
+            return
+
+        wd = self.libc.inotify_add_watch(
+            self.fd, path.encode(sys.getfilesystemencoding()), IN_MASK)
+        if wd < 0:
+            log.warning("Unable to watch %s (errno %d)." % (
+                path, ctypes.get_errno()))
+            return
+
+        self.directories[wd] = path
+        self.paths.add(path)
+
+    def reset(self):
+        # The descriptors are copies of those of the parent process
+        for fd in (self.fd, ) + self._wakeup:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+        self.fd = self.init()
+        self.directories = {}
+        self.paths = set()
+        self._wakeup = os.pipe()
+
+    def run(self):
+        fd, wakeup = self.fd, self._wakeup[0]
+        while True:
+            ready = select.select([fd, wakeup], [], [])[0]
+            if wakeup in ready:
+                break
+
+            data = os.read(fd, 65536)
+            for filename in self.parse(data):
+                self.changed(filename)
+
+        os.close(fd)
+
+    def parse(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            path = self.directories.get(wd)
+            if path is not None and name:
+                yield os.path.join(
+                    path, name.decode(sys.getfilesystemencoding()))
+
+    def stop(self):
+        os.write(self._wakeup[1], b'x')
+        self.join()
+
+
+def get_watcher():
+    """Return the watcher shared by all templates; inotify is used if
+    available, otherwise the watched files are polled."""
+
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            try:
+                _watcher = InotifyWatcher()
+            except (OSError, AttributeError):
+                _watcher = PollingWatcher()
+        return _watcher
+
+
+def _after_fork():
+    global _watcher_lock
+    _watcher_lock = threading.Lock()
+    if _watcher is not None:
+        try:
+            _watcher.reinit()
+        except Exception:
+            log.exception("Unable to set up the watcher after fork.")
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)